@@ -35,12 +35,16 @@ class Config:
     # Tool & Feature Configuration
     perplexity_api_key = None
     esprit_disable_browser = "false"
+    esprit_antigravity_race_endpoints = "false"
+    esprit_offline = "false"
 
     # Runtime Configuration
     esprit_image = "improdead/esprit-sandbox:latest"
     esprit_runtime_backend = "docker"
     esprit_sandbox_execution_timeout = "120"
     esprit_sandbox_connect_timeout = "10"
+    esprit_git_jobs = "4"
+    esprit_git_full_history = "false"
 
     # Telemetry
     esprit_telemetry = "1"
@@ -80,6 +84,10 @@ class Config:
         default = getattr(cls, name, None)
         return os.getenv(env_name, default)
 
+    @classmethod
+    def get_bool(cls, name: str) -> bool:
+        return str(cls.get(name) or "").lower() in ("true", "1", "yes", "on")
+
     @classmethod
     def config_dir(cls) -> Path:
         return Path.home() / ".esprit"
@@ -33,10 +33,11 @@ from esprit.interface.cli import run_cli  # noqa: E402
 from esprit.interface.launchpad import LaunchpadResult, run_launchpad  # noqa: E402
 from esprit.interface.tui import run_tui  # noqa: E402
 from esprit.interface.utils import (  # noqa: E402
+    LayerProgress,
     assign_workspace_subdirs,
     build_final_stats_text,
     check_docker_connection,
-    clone_repository,
+    clone_repositories,
     collect_local_sources,
     generate_run_name,
     image_exists,
@@ -936,11 +937,10 @@ def pull_docker_image() -> None:
 
     with console.status("[bold cyan]Downloading image layers...", spinner="dots") as status:
         try:
-            layers_info: dict[str, str] = {}
-            last_update = ""
+            layers_info = LayerProgress()
 
             for line in client.api.pull(Config.get("esprit_image"), stream=True, decode=True):
-                last_update = process_pull_line(line, layers_info, status, last_update)
+                process_pull_line(line, layers_info, status)
 
         except DockerException as e:
             console.print()
@@ -1035,11 +1035,23 @@ def main() -> None:
 
     args.run_name = generate_run_name(args.targets_info)
 
-    for target_info in args.targets_info:
-        if target_info["type"] == "repository":
-            repo_url = target_info["details"]["target_repo"]
-            dest_name = target_info["details"].get("workspace_subdir")
-            cloned_path = clone_repository(repo_url, args.run_name, dest_name)
+    repo_targets = [t for t in args.targets_info if t["type"] == "repository"]
+    if repo_targets:
+        try:
+            git_jobs = int(Config.get("esprit_git_jobs") or "4")
+        except ValueError:
+            git_jobs = 4
+        full_history = Config.get_bool("esprit_git_full_history")
+        cloned_paths = clone_repositories(
+            [
+                (t["details"]["target_repo"], t["details"].get("workspace_subdir"))
+                for t in repo_targets
+            ],
+            args.run_name,
+            max_workers=git_jobs,
+            full_history=full_history,
+        )
+        for target_info, cloned_path in zip(repo_targets, cloned_paths, strict=True):
             target_info["details"]["cloned_repo_path"] = cloned_path
 
     args.local_sources = collect_local_sources(args.targets_info)
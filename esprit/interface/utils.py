@@ -1,13 +1,18 @@
+import functools
 import ipaddress
-import json
 import re
 import secrets
 import shutil
+import socket
 import subprocess
 import sys
 import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Any
+from typing import Any, NoReturn
 from urllib.error import HTTPError, URLError
 from urllib.parse import urlparse
 from urllib.request import Request, urlopen
@@ -18,6 +23,14 @@ from rich.console import Console
 from rich.panel import Panel
 from rich.text import Text
 
+from esprit.utils import fast_json
+
+
+@functools.cache
+def _get_console() -> Console:
+    """Shared console for one-shot CLI messages; created on first use."""
+    return Console()
+
 
 # Token formatting utilities
 def format_token_count(count: float) -> str:
@@ -200,33 +213,59 @@ def format_vulnerability_report(report: dict[str, Any]) -> Text:  # noqa: PLR091
     return text
 
 
+_SEVERITY_LEVELS = ("critical", "high", "medium", "low", "info")
+
+# Single slot for the most recent tracer: (reports list, reports seen, severity counts,
+# rendered breakdown). vulnerability_reports is append-only during a scan, so the list
+# identity plus its length is a valid cache key.
+_severity_cache: tuple[list[Any], int, dict[str, int], Text] | None = None
+
+
+def _get_severity_breakdown(tracer: Any) -> tuple[dict[str, int], Text]:
+    """Return cached severity counts and the rendered ``SEV: count | ...`` breakdown."""
+    global _severity_cache  # noqa: PLW0603
+    reports = tracer.vulnerability_reports
+    cached = _severity_cache
+    if cached is not None and cached[0] is reports and cached[1] == len(reports):
+        return cached[2], cached[3]
+
+    severity_counts = dict.fromkeys(_SEVERITY_LEVELS, 0)
+    for report in reports:
+        severity = report.get("severity", "").lower()
+        if severity in severity_counts:
+            severity_counts[severity] += 1
+
+    severity_parts = []
+    for severity in _SEVERITY_LEVELS:
+        count = severity_counts[severity]
+        if count > 0:
+            severity_color = get_severity_color(severity)
+            severity_text = Text()
+            severity_text.append(f"{severity.upper()}: ", style=severity_color)
+            severity_text.append(str(count), style=f"bold {severity_color}")
+            severity_parts.append(severity_text)
+
+    # Style the separator through a span: Text.join copies the joiner's base style
+    # onto the result, which would dim every severity.
+    sep = Text()
+    sep.append(" | ", style="dim white")
+    breakdown = sep.join(severity_parts)
+    _severity_cache = (reports, len(reports), severity_counts, breakdown)
+    return severity_counts, breakdown
+
+
+def _render_severity_breakdown(tracer: Any) -> Text:
+    """Return the shared severity breakdown. Callers must not mutate it."""
+    return _get_severity_breakdown(tracer)[1]
+
+
 def _build_vulnerability_stats(stats_text: Text, tracer: Any) -> None:
     """Build vulnerability section of stats text."""
     vuln_count = len(tracer.vulnerability_reports)
 
     if vuln_count > 0:
-        severity_counts = {"critical": 0, "high": 0, "medium": 0, "low": 0, "info": 0}
-        for report in tracer.vulnerability_reports:
-            severity = report.get("severity", "").lower()
-            if severity in severity_counts:
-                severity_counts[severity] += 1
-
         stats_text.append("Vulnerabilities  ", style="bold red")
-
-        severity_parts = []
-        for severity in ["critical", "high", "medium", "low", "info"]:
-            count = severity_counts[severity]
-            if count > 0:
-                severity_color = get_severity_color(severity)
-                severity_text = Text()
-                severity_text.append(f"{severity.upper()}: ", style=severity_color)
-                severity_text.append(str(count), style=f"bold {severity_color}")
-                severity_parts.append(severity_text)
-
-        for i, part in enumerate(severity_parts):
-            stats_text.append(part)
-            if i < len(severity_parts) - 1:
-                stats_text.append(" | ", style="dim white")
+        stats_text.append(_render_severity_breakdown(tracer))
 
         stats_text.append(" (Total: ", style="dim white")
         stats_text.append(str(vuln_count), style="bold yellow")
@@ -316,27 +355,7 @@ def build_live_stats_text(tracer: Any, agent_config: dict[str, Any] | None = Non
     stats_text.append(f"{vuln_count}", style="white")
     stats_text.append("\n")
     if vuln_count > 0:
-        severity_counts = {"critical": 0, "high": 0, "medium": 0, "low": 0, "info": 0}
-        for report in tracer.vulnerability_reports:
-            severity = report.get("severity", "").lower()
-            if severity in severity_counts:
-                severity_counts[severity] += 1
-
-        severity_parts = []
-        for severity in ["critical", "high", "medium", "low", "info"]:
-            count = severity_counts[severity]
-            if count > 0:
-                severity_color = get_severity_color(severity)
-                severity_text = Text()
-                severity_text.append(f"{severity.upper()}: ", style=severity_color)
-                severity_text.append(str(count), style=f"bold {severity_color}")
-                severity_parts.append(severity_text)
-
-        for i, part in enumerate(severity_parts):
-            stats_text.append(part)
-            if i < len(severity_parts) - 1:
-                stats_text.append(" | ", style="dim white")
-
+        stats_text.append(_render_severity_breakdown(tracer))
         stats_text.append("\n")
 
     stats_text.append("Agents ", style="dim")
@@ -347,20 +366,23 @@ def build_live_stats_text(tracer: Any, agent_config: dict[str, Any] | None = Non
 
     llm_stats = tracer.get_total_llm_stats()
     total_stats = llm_stats["total"]
+    input_tokens = total_stats["input_tokens"]
+    output_tokens = total_stats["output_tokens"]
+    cached_tokens = total_stats["cached_tokens"]
 
     stats_text.append("\n")
 
     stats_text.append("Input Tokens ", style="dim")
-    stats_text.append(format_token_count(total_stats["input_tokens"]), style="white")
+    stats_text.append(format_token_count(input_tokens), style="white")
 
     stats_text.append("  ·  ", style="dim white")
     stats_text.append("Cached Tokens ", style="dim")
-    stats_text.append(format_token_count(total_stats["cached_tokens"]), style="white")
+    stats_text.append(format_token_count(cached_tokens), style="white")
 
     stats_text.append("\n")
 
     stats_text.append("Output Tokens ", style="dim")
-    stats_text.append(format_token_count(total_stats["output_tokens"]), style="white")
+    stats_text.append(format_token_count(output_tokens), style="white")
 
     stats_text.append("  ·  ", style="dim white")
 
@@ -373,10 +395,7 @@ def build_live_stats_text(tracer: Any, agent_config: dict[str, Any] | None = Non
     from esprit.llm.pricing import get_pricing_db
 
     session_cost = get_pricing_db().get_cost(
-        model,
-        total_stats["input_tokens"],
-        total_stats["output_tokens"],
-        total_stats["cached_tokens"],
+        model, input_tokens, output_tokens, cached_tokens,
     ) if model else 0.0
 
     stats_text.append("Cost ", style="dim")
@@ -482,13 +501,13 @@ def build_tui_stats_text(
     total_stats = llm_stats["total"]
     input_tokens = total_stats["input_tokens"]
     output_tokens = total_stats["output_tokens"]
-
-    from esprit.llm.pricing import get_pricing_db, get_lifetime_cost
     cached_tokens = total_stats["cached_tokens"]
-    total_tokens = input_tokens + output_tokens
     requests = total_stats["requests"]
+    total_tokens = input_tokens + output_tokens
     context_tokens = llm_stats.get("max_context_tokens", 0)
 
+    from esprit.llm.pricing import get_pricing_db, get_lifetime_cost
+
     # Agents / Tools / Requests
     stats_text.append("\n")
     if scan_failed:
@@ -584,13 +603,10 @@ def build_tui_stats_text(
         stats_text.append("vulns found", style="#dc2626")
 
         # Severity mini-breakdown
-        severity_counts: dict[str, int] = {}
-        for report in tracer.vulnerability_reports:
-            sev = report.get("severity", "").lower()
-            severity_counts[sev] = severity_counts.get(sev, 0) + 1
+        severity_counts = _get_severity_breakdown(tracer)[0]
         sev_parts = []
-        for sev in ["critical", "high", "medium", "low", "info"]:
-            c = severity_counts.get(sev, 0)
+        for sev in _SEVERITY_LEVELS:
+            c = severity_counts[sev]
             if c > 0:
                 sev_parts.append((c, sev, get_severity_color(sev)))
         if sev_parts:
@@ -700,6 +716,12 @@ def _is_http_git_repo(url: str) -> bool:
         return False
 
 
+# Cheap gate so URLs and domains never reach ipaddress' exception-driven parsing.
+_IP_SHAPE = re.compile(
+    r"^(?:\d{1,3}(?:\.\d{1,3}){3}|[0-9a-fA-F:.]*:[0-9a-fA-F:.]*(?:%[^\s/]+)?)$"
+)
+
+
 def infer_target_type(target: str) -> tuple[str, dict[str, str]]:  # noqa: PLR0911, PLR0912
     if not target or not isinstance(target, str):
         raise ValueError("Target must be a non-empty string")
@@ -725,12 +747,13 @@ def infer_target_type(target: str) -> tuple[str, dict[str, str]]:  # noqa: PLR09
             return "repository", {"target_repo": target}
         return "web_application", {"target_url": target}
 
-    try:
-        ip_obj = ipaddress.ip_address(target)
-    except ValueError:
-        pass
-    else:
-        return "ip_address", {"target_ip": str(ip_obj)}
+    if _IP_SHAPE.match(target):
+        try:
+            ip_obj = ipaddress.ip_address(target)
+        except ValueError:
+            pass
+        else:
+            return "ip_address", {"target_ip": str(ip_obj)}
 
     path = Path(target).expanduser()
     try:
@@ -798,7 +821,7 @@ def derive_local_base_name(path_str: str) -> str:
 
 
 def assign_workspace_subdirs(targets_info: list[dict[str, Any]]) -> None:
-    name_counts: dict[str, int] = {}
+    name_counts: Counter[str] = Counter()
 
     for target in targets_info:
         target_type = target["type"]
@@ -813,8 +836,8 @@ def assign_workspace_subdirs(targets_info: list[dict[str, Any]]) -> None:
         if base_name is None:
             continue
 
-        count = name_counts.get(base_name, 0) + 1
-        name_counts[base_name] = count
+        name_counts[base_name] += 1
+        count = name_counts[base_name]
 
         workspace_subdir = base_name if count == 1 else f"{base_name}-{count}"
 
@@ -847,122 +870,221 @@ def collect_local_sources(targets_info: list[dict[str, Any]]) -> list[dict[str,
     return local_sources
 
 
+_LOCALHOST_LITERALS = frozenset({"localhost", "0.0.0.0", "::1", "127.0.0.1"})  # nosec B104
+_IPV6_LOOPBACK = b"\x00" * 15 + b"\x01"
+
+
+@functools.lru_cache(maxsize=512)
 def _is_localhost_host(host: str) -> bool:
     host_lower = host.lower().strip("[]")
 
-    if host_lower in ("localhost", "0.0.0.0", "::1"):  # nosec B104
+    if host_lower in _LOCALHOST_LITERALS:
         return True
 
+    # Only the address family the host can belong to is parsed, so domains and
+    # IPv4 literals never pay for a failed IPv6 parse (and vice versa).
+    if ":" in host_lower:
+        try:
+            return socket.inet_pton(socket.AF_INET6, host_lower) == _IPV6_LOOPBACK  # ::1
+        except (OSError, ValueError):
+            return False
+
+    if not host_lower.startswith("127."):
+        return False
+
     try:
-        ip = ipaddress.ip_address(host_lower)
-        if isinstance(ip, ipaddress.IPv4Address):
-            return ip.is_loopback  # 127.0.0.0/8
-        if isinstance(ip, ipaddress.IPv6Address):
-            return ip.is_loopback  # ::1
-    except ValueError:
-        pass
+        socket.inet_pton(socket.AF_INET, host_lower)  # 127.0.0.0/8
+    except (OSError, ValueError):
+        return False
+    return True
 
-    return False
+
+# Substrings any URL with a loopback host must contain ("[" covers all IPv6 literals).
+_LOCALHOST_URL_MARKERS = ("localhost", "127.", "0.0.0.0", "[")  # nosec B104
+
+
+def _may_target_localhost(target_info: dict[str, Any]) -> bool:
+    target_type = target_info.get("type")
+    if target_type == "ip_address":
+        return True
+    if target_type != "web_application":
+        return False
+    target_url = str(target_info.get("details", {}).get("target_url", "")).lower()
+    return any(marker in target_url for marker in _LOCALHOST_URL_MARKERS)
 
 
 def rewrite_localhost_targets(targets_info: list[dict[str, Any]], host_gateway: str) -> None:
-    from yarl import URL  # type: ignore[import-not-found]
+    candidates = [t for t in targets_info if _may_target_localhost(t)]
+    if not candidates:
+        return
 
-    for target_info in targets_info:
-        target_type = target_info.get("type")
+    for target_info in candidates:
         details = target_info.get("details", {})
 
-        if target_type == "web_application":
-            target_url = details.get("target_url", "")
+        if target_info.get("type") == "web_application":
+            from yarl import URL  # type: ignore[import-not-found]
+
             try:
-                url = URL(target_url)
+                url = URL(details.get("target_url", ""))
             except (ValueError, TypeError):
                 continue
 
             if url.host and _is_localhost_host(url.host):
                 details["target_url"] = str(url.with_host(host_gateway))
 
-        elif target_type == "ip_address":
+        else:
             target_ip = details.get("target_ip", "")
             if target_ip and _is_localhost_host(target_ip):
                 details["target_ip"] = host_gateway
 
 
 # Repository utilities
-def clone_repository(repo_url: str, run_name: str, dest_name: str | None = None) -> str:
-    console = Console()
+@functools.cache
+def _find_git_executable() -> str | None:
+    return shutil.which("git")
 
-    git_executable = shutil.which("git")
-    if git_executable is None:
-        raise FileNotFoundError("Git executable not found in PATH")
 
+def _prepare_clone_path(repo_url: str, run_name: str, dest_name: str | None) -> Path:
     temp_dir = Path(tempfile.gettempdir()) / "esprit_repos" / run_name
     temp_dir.mkdir(parents=True, exist_ok=True)
 
     if dest_name:
         repo_name = dest_name
     else:
-        repo_name = Path(repo_url).stem if repo_url.endswith(".git") else Path(repo_url).name
+        # URLs aren't filesystem paths; take the basename after the last "/" (or the
+        # ":" of scp-style git@host:repo.git) and drop a trailing ".git".
+        last = repo_url.rstrip("/").rsplit("/", 1)[-1].rsplit(":", 1)[-1]
+        repo_name = last.removesuffix(".git")
 
     clone_path = temp_dir / repo_name
 
     if clone_path.exists():
         shutil.rmtree(clone_path)
 
-    try:
-        with console.status(f"[bold cyan]Cloning repository {repo_url}...", spinner="dots"):
-            subprocess.run(  # noqa: S603
-                [
-                    git_executable,
-                    "clone",
-                    repo_url,
-                    str(clone_path),
-                ],
-                capture_output=True,
-                text=True,
-                check=True,
-            )
+    return clone_path
 
-        return str(clone_path.absolute())
 
-    except subprocess.CalledProcessError as e:
-        error_text = Text()
+def _run_git_clone(
+    git_executable: str, repo_url: str, clone_path: Path, full_history: bool = False
+) -> str:
+    clone_args = [git_executable, "-c", "protocol.version=2", "clone"]
+    if not full_history:
+        # Scans only need the current tree; skip history and tags.
+        clone_args += ["--depth=1", "--single-branch", "--no-tags"]
+    clone_args += [repo_url, str(clone_path)]
+    subprocess.run(  # noqa: S603
+        clone_args,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return str(clone_path.absolute())
+
+
+def _exit_with_clone_error(
+    console: Console, repo_url: str, error: subprocess.CalledProcessError | FileNotFoundError
+) -> NoReturn:
+    error_text = Text()
+    if isinstance(error, subprocess.CalledProcessError):
         error_text.append("REPOSITORY CLONE FAILED", style="bold red")
         error_text.append("\n\n", style="white")
         error_text.append(f"Could not clone repository: {repo_url}\n", style="white")
         error_text.append(
-            f"Error: {e.stderr if hasattr(e, 'stderr') and e.stderr else str(e)}", style="dim red"
-        )
-
-        panel = Panel(
-            error_text,
-            title="[bold white]ESPRIT",
-            title_align="left",
-            border_style="red",
-            padding=(1, 2),
+            f"Error: {error.stderr if hasattr(error, 'stderr') and error.stderr else str(error)}",
+            style="dim red",
         )
-        console.print("\n")
-        console.print(panel)
-        console.print()
-        sys.exit(1)
-    except FileNotFoundError:
-        error_text = Text()
+    else:
         error_text.append("GIT NOT FOUND", style="bold red")
         error_text.append("\n\n", style="white")
         error_text.append("Git is not installed or not available in PATH.\n", style="white")
         error_text.append("Please install Git to clone repositories.\n", style="white")
 
-        panel = Panel(
-            error_text,
-            title="[bold white]ESPRIT",
-            title_align="left",
-            border_style="red",
-            padding=(1, 2),
-        )
-        console.print("\n")
-        console.print(panel)
-        console.print()
-        sys.exit(1)
+    panel = Panel(
+        error_text,
+        title="[bold white]ESPRIT",
+        title_align="left",
+        border_style="red",
+        padding=(1, 2),
+    )
+    console.print("\n")
+    console.print(panel)
+    console.print()
+    sys.exit(1)
+
+
+def clone_repository(
+    repo_url: str,
+    run_name: str,
+    dest_name: str | None = None,
+    full_history: bool = False,
+) -> str:
+    console = _get_console()
+
+    git_executable = _find_git_executable()
+    if git_executable is None:
+        raise FileNotFoundError("Git executable not found in PATH")
+
+    clone_path = _prepare_clone_path(repo_url, run_name, dest_name)
+
+    try:
+        with console.status(f"[bold cyan]Cloning repository {repo_url}...", spinner="dots"):
+            return _run_git_clone(git_executable, repo_url, clone_path, full_history)
+    except (subprocess.CalledProcessError, FileNotFoundError) as e:
+        _exit_with_clone_error(console, repo_url, e)
+
+
+def clone_repositories(
+    repos: list[tuple[str, str | None]],
+    run_name: str,
+    max_workers: int = 4,
+    full_history: bool = False,
+) -> list[str]:
+    """Clone ``(repo_url, dest_name)`` pairs concurrently, preserving input order.
+
+    git runs in a subprocess, so plain threads overlap the network-bound clones.
+    """
+    if len(repos) <= 1 or max_workers <= 1:
+        return [
+            clone_repository(repo_url, run_name, dest_name, full_history)
+            for repo_url, dest_name in repos
+        ]
+
+    console = _get_console()
+
+    git_executable = _find_git_executable()
+    if git_executable is None:
+        raise FileNotFoundError("Git executable not found in PATH")
+
+    clone_paths = [
+        _prepare_clone_path(repo_url, run_name, dest_name) for repo_url, dest_name in repos
+    ]
+    results: list[str] = [""] * len(repos)
+    total = len(repos)
+
+    with (
+        console.status(f"[bold cyan]Cloning {total} repositories...", spinner="dots") as status,
+        ThreadPoolExecutor(max_workers=min(max_workers, total)) as executor,
+    ):
+        futures = {
+            executor.submit(
+                _run_git_clone, git_executable, repo_url, clone_path, full_history
+            ): index
+            for index, ((repo_url, _), clone_path) in enumerate(
+                zip(repos, clone_paths, strict=True)
+            )
+        }
+        for done, future in enumerate(as_completed(futures), start=1):
+            index = futures[future]
+            try:
+                results[index] = future.result()
+            except (subprocess.CalledProcessError, FileNotFoundError) as e:
+                for pending in futures:
+                    pending.cancel()
+                status.stop()
+                _exit_with_clone_error(console, repos[index][0], e)
+            status.update(f"[bold cyan]Cloned {done}/{total} repositories...")
+
+    return results
 
 
 # Docker utilities
@@ -970,7 +1092,7 @@ def check_docker_connection() -> Any:
     try:
         return docker.from_env()
     except DockerException:
-        console = Console()
+        console = _get_console()
         error_text = Text()
         error_text.append("DOCKER NOT AVAILABLE", style="bold red")
         error_text.append("\n\n", style="white")
@@ -1000,32 +1122,59 @@ def image_exists(client: Any, image_name: str) -> bool:
         return True
 
 
-def update_layer_status(layers_info: dict[str, str], layer_id: str, layer_status: str) -> None:
-    if "Pull complete" in layer_status or "Already exists" in layer_status:
-        layers_info[layer_id] = "✓"
-    elif "Downloading" in layer_status:
-        layers_info[layer_id] = "↓"
-    elif "Extracting" in layer_status:
-        layers_info[layer_id] = "📦"
-    elif "Waiting" in layer_status:
-        layers_info[layer_id] = "⏳"
-    else:
-        layers_info[layer_id] = "•"
+@dataclass(slots=True)
+class LayerProgress:
+    """Per-layer pull status, a running completed count and the last progress shown."""
 
+    layers: dict[str, str] = field(default_factory=dict)
+    completed: int = 0
+    shown: tuple[int, int] = (-1, -1)
+    shown_at: float = 0.0
 
-def process_pull_line(
-    line: dict[str, Any], layers_info: dict[str, str], status: Any, last_update: str
-) -> str:
+
+_PULL_STATUS_INTERVAL_S = 0.1
+
+# Docker reports these statuses verbatim, so most lines resolve with one dict lookup;
+# the ordered scan keeps substring matching for anything decorated.
+_LAYER_STATUS_GLYPHS = (
+    ("Pull complete", "✓"),
+    ("Already exists", "✓"),
+    ("Downloading", "↓"),
+    ("Extracting", "📦"),
+    ("Waiting", "⏳"),
+)
+_LAYER_STATUS_EXACT = dict(_LAYER_STATUS_GLYPHS)
+
+
+def update_layer_status(layers_info: LayerProgress, layer_id: str, layer_status: str) -> None:
+    new_status = _LAYER_STATUS_EXACT.get(layer_status)
+    if new_status is None:
+        new_status = next(
+            (glyph for keyword, glyph in _LAYER_STATUS_GLYPHS if keyword in layer_status), "•"
+        )
+
+    was_complete = layers_info.layers.get(layer_id) == "✓"
+    layers_info.layers[layer_id] = new_status
+    is_complete = new_status == "✓"
+    if is_complete != was_complete:
+        layers_info.completed += 1 if is_complete else -1
+
+
+def process_pull_line(line: dict[str, Any], layers_info: LayerProgress, status: Any) -> str | None:
     if "id" in line and "status" in line:
         layer_id = line["id"]
         update_layer_status(layers_info, layer_id, line["status"])
 
-        completed = sum(1 for v in layers_info.values() if v == "✓")
-        total = len(layers_info)
+        completed = layers_info.completed
+        total = len(layers_info.layers)
 
-        if total > 0:
-            update_msg = f"[bold cyan]Progress: {completed}/{total} layers complete"
-            if update_msg != last_update:
+        if total > 0 and (completed, total) != layers_info.shown:
+            now = time.monotonic()
+            # The spinner redraws on its own; cap text refreshes but never drop the final one.
+            if completed == total or now - layers_info.shown_at >= _PULL_STATUS_INTERVAL_S:
+                update_msg = f"[bold cyan]Progress: {completed}/{total} layers complete"
+                layers_info.shown = (completed, total)
+                layers_info.shown_at = now
                 status.update(update_msg)
                 return update_msg
 
@@ -1038,7 +1187,7 @@ def process_pull_line(
         elif "Status:" in global_status:
             status.update("[bold cyan]Finalizing...")
 
-    return last_update
+    return None
 
 
 # LLM utilities
@@ -1048,7 +1197,7 @@ def validate_llm_response(response: Any) -> None:
 
 
 def validate_config_file(config_path: str) -> Path:
-    console = Console()
+    console = _get_console()
     path = Path(config_path)
 
     if not path.exists():
@@ -1060,9 +1209,8 @@ def validate_config_file(config_path: str) -> Path:
         sys.exit(1)
 
     try:
-        with path.open("r", encoding="utf-8") as f:
-            data = json.load(f)
-    except json.JSONDecodeError as e:
+        data = fast_json.loads(path.read_bytes())
+    except (fast_json.JSONDecodeError, UnicodeDecodeError) as e:
         console.print(f"[bold red]Error:[/] Invalid JSON in config file: {e}")
         sys.exit(1)
 
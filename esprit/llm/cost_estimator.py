@@ -2,6 +2,7 @@
 
 from __future__ import annotations
 
+import functools
 import logging
 from typing import Any
 
@@ -39,6 +40,23 @@ def estimate_scan_cost(
     is_whitebox: bool = False,
 ) -> dict[str, Any]:
     """Estimate the cost of a scan. Returns cost range (low/mid/high) in USD."""
+    db = get_pricing_db()
+    db.ensure_loaded()
+    # Keyed on the DB version so estimates refresh once remote pricing lands.
+    estimate = _estimate_scan_cost_cached(
+        model_name, scan_mode, target_count, is_whitebox, db.data_version
+    )
+    return dict(estimate)
+
+
+@functools.lru_cache(maxsize=256)
+def _estimate_scan_cost_cached(
+    model_name: str,
+    scan_mode: str,
+    target_count: int,
+    is_whitebox: bool,
+    pricing_version: int,  # noqa: ARG001
+) -> dict[str, Any]:
     mode_config = _MODE_TOKEN_ESTIMATES.get(scan_mode, _MODE_TOKEN_ESTIMATES["deep"])
 
     base_input = mode_config["input_tokens_per_target"]
@@ -1,26 +1,41 @@
 import asyncio
-import json
+import functools
 import logging
-from collections.abc import AsyncIterator
+from collections.abc import AsyncGenerator, AsyncIterator, Mapping
 from dataclasses import dataclass
+from pathlib import Path
+from types import MappingProxyType
 from typing import Any
 
 import httpx
 import litellm
-from jinja2 import Environment, FileSystemLoader, select_autoescape
-from litellm import acompletion, stream_chunk_builder, supports_reasoning
+from jinja2 import (
+    BytecodeCache,
+    Environment,
+    FileSystemBytecodeCache,
+    FileSystemLoader,
+    select_autoescape,
+)
+from litellm import acompletion, supports_reasoning
 from litellm.utils import supports_prompt_caching, supports_vision
 
 from esprit.config import Config
 from esprit.llm.config import LLMConfig
 from esprit.llm.memory_compressor import MemoryCompressor
+from esprit.llm.pricing import get_pricing_db
 from esprit.llm.utils import (
+    StreamAccumulator,
+    ThinkingAccumulator,
     _truncate_to_first_function,
     fix_incomplete_tool_call,
     parse_tool_invocations,
 )
 from esprit.skills import load_skills
+from esprit.telemetry import posthog
+from esprit.telemetry.tracer import get_global_tracer
 from esprit.tools import get_tools_prompt
+from esprit.utils import fast_json
+from esprit.utils.loop_clients import LoopClients
 from esprit.utils.resource_paths import get_esprit_resource_path
 
 # Provider OAuth integration (Codex, Copilot, Gemini, Anthropic, Antigravity)
@@ -32,8 +47,14 @@ try:
         get_auth_client,
     )
     from esprit.providers.account_pool import get_account_pool
-    from esprit.providers.antigravity import ANTIGRAVITY_MODELS, ENDPOINTS
+    from esprit.providers.antigravity import (
+        ANTIGRAVITY_MODELS,
+        ENDPOINTS,
+        _discover_project,
+        get_fallback_models,
+    )
     from esprit.providers.antigravity_format import (
+        aiter_sse_data,
         build_cloudcode_request,
         build_request_headers,
         parse_sse_chunk,
@@ -58,7 +79,7 @@ litellm.modify_params = True
 
 # Register Codex models that may not yet be in litellm's model cost map.
 # litellm needs mode=responses so it routes to /responses instead of /chat/completions.
-_CODEX_BASE_INFO = {
+_CODEX_BASE_INFO: Mapping[str, Any] = MappingProxyType({
     "mode": "responses",
     "max_input_tokens": 272000,
     "max_output_tokens": 128000,
@@ -66,12 +87,131 @@ _CODEX_BASE_INFO = {
     "supports_vision": True,
     "supports_reasoning": True,
     "supports_native_streaming": True,
-}
-for _base in ["gpt-5.3-codex", "gpt-5.2-codex"]:
+})
+for _base in ("gpt-5.3-codex", "gpt-5.2-codex"):
     if _base not in litellm.model_cost:
         litellm.model_cost[_base] = {**_CODEX_BASE_INFO, "litellm_provider": "openai"}
 
 
+@functools.cache
+def _get_prompt_bytecode_cache() -> BytecodeCache | None:
+    """On-disk cache of compiled templates so new processes skip lexing and parsing."""
+    cache_dir = Config.config_dir() / "cache" / "jinja"
+    try:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+    except OSError:
+        return None
+    return FileSystemBytecodeCache(directory=str(cache_dir))
+
+
+@functools.lru_cache(maxsize=16)
+def _get_prompt_env(prompt_dir: Path, skills_dir: Path) -> Environment:
+    """Shared Jinja environment per template search path; templates compile once."""
+    return Environment(
+        loader=FileSystemLoader([prompt_dir, skills_dir]),
+        autoescape=select_autoescape(enabled_extensions=(), default_for_string=False),
+        auto_reload=False,
+        bytecode_cache=_get_prompt_bytecode_cache(),
+    )
+
+
+@functools.lru_cache(maxsize=32)
+def _render_system_prompt(agent_name: str, scan_mode: str, skills: tuple[str, ...]) -> str:
+    env = _get_prompt_env(
+        get_esprit_resource_path("agents", agent_name), get_esprit_resource_path("skills")
+    )
+
+    skills_to_load = [*skills, f"scan_modes/{scan_mode}"]
+    skill_content = load_skills(skills_to_load)
+
+    # get_skill is passed per render rather than set on env.globals, which is shared.
+    result = env.get_template("system_prompt.jinja").render(
+        get_tools_prompt=get_tools_prompt,
+        get_skill=lambda name: skill_content.get(name, ""),
+        loaded_skill_names=list(skill_content.keys()),
+        **skill_content,
+    )
+    return str(result)
+
+
+# litellm capability lookups walk model_cost and normalize names on every call.
+@functools.lru_cache(maxsize=256)
+def _model_supports_vision(model: str | None) -> bool:
+    try:
+        return bool(supports_vision(model=model))
+    except Exception:  # noqa: BLE001
+        return False
+
+
+@functools.lru_cache(maxsize=256)
+def _model_supports_reasoning(model: str | None) -> bool:
+    try:
+        return bool(supports_reasoning(model=model))
+    except Exception:  # noqa: BLE001
+        return False
+
+
+@functools.lru_cache(maxsize=256)
+def _model_supports_prompt_caching(model: str | None) -> bool:
+    try:
+        return bool(supports_prompt_caching(model))
+    except Exception:  # noqa: BLE001
+        return False
+
+
+def _new_antigravity_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        timeout=httpx.Timeout(120.0),
+        limits=httpx.Limits(max_keepalive_connections=32, keepalive_expiry=60),
+    )
+
+
+_antigravity_clients = LoopClients(_new_antigravity_client)
+
+
+def _get_antigravity_client() -> httpx.AsyncClient:
+    """Pooled Cloud Code client so turns and retries reuse warm TLS connections.
+
+    One client per event loop, closed when that loop's ``asyncio.run`` session ends.
+    """
+    return _antigravity_clients.get()
+
+
+def _has_image_part(content: Any) -> bool:
+    return isinstance(content, list) and any(
+        isinstance(item, dict) and item.get("type") == "image_url" for item in content
+    )
+
+
+# Explicit provider prefixes that always route away from Antigravity.
+_NON_AG_PREFIXES: frozenset[str] = frozenset({
+    "anthropic", "google", "openai", "bedrock", "github-copilot", "gemini", "azure", "vertex_ai",
+})
+
+
+_AG_BAD_REQUEST_RETRIES = 2
+
+
+def _history_fingerprint(history: list[dict[str, Any]]) -> tuple[int, int, int] | None:
+    """Cheap identity of a history: its length plus the identity and content of the tail.
+
+    Non-string content is hashed by value, so a multimodal list extended in place
+    changes the fingerprint. Returns None (always compress) if it can't be serialized.
+    """
+    if not history:
+        return None
+    last = history[-1]
+    content = last.get("content")
+    if isinstance(content, str):
+        content_hash = hash(content)
+    else:
+        try:
+            content_hash = hash(fast_json.dumps_bytes(content))
+        except (TypeError, ValueError):
+            return None
+    return len(history), id(last), content_hash
+
+
 class LLMRequestFailedError(Exception):
     def __init__(self, message: str, details: str | None = None):
         super().__init__(message)
@@ -111,8 +251,13 @@ class LLM:
         self.agent_name = agent_name
         self.agent_id: str | None = None
         self._total_stats = RequestStats()
+        self._last_compress_fingerprint: tuple[int, int, int] | None = None
+        self._recompute_model_parts()
         self.memory_compressor = MemoryCompressor(model_name=config.model_name)
         self.system_prompt = self._load_system_prompt(agent_name)
+        self._system_msg: dict[str, Any] = {"role": "system", "content": self.system_prompt}
+        self._identity_msg: dict[str, Any] | None = None
+        self._refresh_identity_msg()
 
         reasoning = Config.get("esprit_reasoning_effort")
         if reasoning:
@@ -122,31 +267,26 @@ class LLM:
         else:
             self._reasoning_effort = "high"
 
+    def _recompute_model_parts(self) -> None:
+        """Split the model name once; call again whenever ``config.model_name`` changes."""
+        model = self.config.model_name or ""
+        self._model_lower = model.lower()
+        if "/" in model:
+            self._model_prefix, self._model_bare = model.split("/", 1)
+        else:
+            self._model_prefix, self._model_bare = "", model
+        # Routing flags are derived lazily from the parts above.
+        self._anthropic_flag: bool | None = None
+        self._antigravity_flag: bool | None = None
+
     def _load_system_prompt(self, agent_name: str | None) -> str:
         if not agent_name:
             return ""
 
         try:
-            prompt_dir = get_esprit_resource_path("agents", agent_name)
-            skills_dir = get_esprit_resource_path("skills")
-            env = Environment(
-                loader=FileSystemLoader([prompt_dir, skills_dir]),
-                autoescape=select_autoescape(enabled_extensions=(), default_for_string=False),
-            )
-
-            skills_to_load = [
-                *list(self.config.skills or []),
-                f"scan_modes/{self.config.scan_mode}",
-            ]
-            skill_content = load_skills(skills_to_load)
-            env.globals["get_skill"] = lambda name: skill_content.get(name, "")
-
-            result = env.get_template("system_prompt.jinja").render(
-                get_tools_prompt=get_tools_prompt,
-                loaded_skill_names=list(skill_content.keys()),
-                **skill_content,
+            return _render_system_prompt(
+                agent_name, self.config.scan_mode, tuple(self.config.skills or ())
             )
-            return str(result)
         except Exception:  # noqa: BLE001
             return ""
 
@@ -155,6 +295,22 @@ class LLM:
             self.agent_name = agent_name
         if agent_id:
             self.agent_id = agent_id
+        self._refresh_identity_msg()
+
+    def _refresh_identity_msg(self) -> None:
+        if not self.agent_name:
+            self._identity_msg = None
+            return
+        self._identity_msg = {
+            "role": "user",
+            "content": (
+                f"\n\n<agent_identity>\n"
+                f"<meta>Internal metadata: do not echo or reference.</meta>\n"
+                f"<agent_name>{self.agent_name}</agent_name>\n"
+                f"<agent_id>{self.agent_id}</agent_id>\n"
+                f"</agent_identity>\n\n"
+            ),
+        }
 
     async def generate(
         self, conversation_history: list[dict[str, Any]]
@@ -189,40 +345,47 @@ class LLM:
                 attempt += 1
 
     async def _stream(self, messages: list[dict[str, Any]]) -> AsyncIterator[LLMResponse]:
-        accumulated = ""
-        chunks: list[Any] = []
+        buffer = StreamAccumulator()
+        thinking = ThinkingAccumulator() if self._supports_reasoning() else None
+        final_usage: Any = None
+        received_chunks = False
         done_streaming = 0
 
         self._total_stats.requests += 1
         response = await acompletion(**self._build_completion_args(messages), stream=True)
 
         async for chunk in response:
-            chunks.append(chunk)
+            received_chunks = True
+            if usage := getattr(chunk, "usage", None):
+                final_usage = usage
+            if thinking is not None and chunk.choices:
+                chunk_delta = getattr(chunk.choices[0], "delta", None)
+                thinking.add(getattr(chunk_delta, "thinking_blocks", None))
             if done_streaming:
                 done_streaming += 1
-                if getattr(chunk, "usage", None) or done_streaming > 5:
+                if usage or done_streaming > 5:
                     break
                 continue
             delta = self._get_chunk_content(chunk)
             if delta:
-                accumulated += delta
-                if "</function>" in accumulated:
-                    accumulated = accumulated[
-                        : accumulated.find("</function>") + len("</function>")
-                    ]
-                    yield LLMResponse(content=accumulated)
+                if buffer.add(delta):
+                    yield LLMResponse(content=buffer.text)
                     done_streaming = 1
                     continue
-                yield LLMResponse(content=accumulated)
+                if buffer.should_emit():
+                    yield LLMResponse(content=buffer.text)
 
-        if chunks:
-            self._update_usage_stats(stream_chunk_builder(chunks))
+        if received_chunks:
+            if final_usage is None:
+                # Some providers ignore stream_options.include_usage; count locally
+                final_usage = self._estimate_usage(messages, buffer.text)
+            self._update_usage_stats(final_usage)
 
-        accumulated = fix_incomplete_tool_call(_truncate_to_first_function(accumulated))
+        accumulated = fix_incomplete_tool_call(_truncate_to_first_function(buffer.text))
         yield LLMResponse(
             content=accumulated,
             tool_invocations=parse_tool_invocations(accumulated),
-            thinking_blocks=self._extract_thinking(chunks),
+            thinking_blocks=thinking.blocks() if thinking is not None else None,
         )
 
     async def _stream_antigravity(self, messages: list[dict[str, Any]]) -> AsyncIterator[LLMResponse]:
@@ -245,15 +408,12 @@ class LLM:
 
         # Re-discover project if missing
         if not project_id:
-            from esprit.providers.antigravity import _discover_project
             project_id, _ = await _discover_project(access_token)
             if not project_id:
                 raise LLMRequestFailedError("No Antigravity project ID. Re-login with 'esprit provider login'.")
 
-        # Extract bare model name (strip any provider prefix like "antigravity/", "google/")
-        model = self.config.model_name
-        if "/" in model:
-            model = model.split("/", 1)[1]
+        # Bare model name (without any provider prefix like "antigravity/", "google/")
+        model = self._model_bare
 
         # Build Cloud Code request
         request_body = build_cloudcode_request(
@@ -264,47 +424,60 @@ class LLM:
         )
         headers = build_request_headers(access_token, model)
 
-        # Try endpoints in order; skip production for Claude models
+        # Production endpoint doesn't support Claude — skip it
         is_claude = "claude" in model
+        urls = [
+            f"{endpoint}/v1internal:streamGenerateContent?alt=sse"
+            for endpoint in ENDPOINTS
+            if not is_claude or "sandbox" in endpoint
+        ]
+
+        raced_errors: dict[str, BaseException] = {}
+        if not is_claude and len(urls) > 1 and Config.get_bool("esprit_antigravity_race_endpoints"):
+            raced = await self._race_antigravity_endpoints(urls, headers, request_body)
+            if isinstance(raced, dict):
+                # Every endpoint failed; dispatch their errors below instead of
+                # re-sending requests that each cost quota.
+                raced_errors = raced
+            else:
+                stream, first = raced
+                try:
+                    yield first
+                    async for response in stream:
+                        yield response
+                finally:
+                    await stream.aclose()
+                return
+
+        # Try endpoints in order
         last_error = None
-        for endpoint in ENDPOINTS:
-            # Production endpoint doesn't support Claude — skip it
-            if is_claude and "sandbox" not in endpoint:
-                continue
-            url = f"{endpoint}/v1internal:streamGenerateContent?alt=sse"
+        for url in urls:
             try:
+                if (raced_error := raced_errors.get(url)) is not None:
+                    if isinstance(raced_error, StopAsyncIteration):
+                        return  # the stream finished without producing a response
+                    raise raced_error
                 async for response in self._do_antigravity_stream(url, headers, request_body):
                     yield response
                 return
             except httpx.HTTPStatusError as e:
-                if e.response.status_code == 429:
-                    # Mark rate-limited and let generate() handle rotation
-                    raise
-                if e.response.status_code in (401, 403):
-                    # Auth errors — retrying won't help
-                    raise
-                if e.response.status_code == 400:
-                    # Cloud Code 400s can be transient — retry on same endpoint
-                    retried = False
-                    last_retry_error = e
-                    for retry in range(2):
-                        await asyncio.sleep(2 * (retry + 1))
-                        try:
-                            async for response in self._do_antigravity_stream(url, headers, request_body):
-                                yield response
-                            retried = True
-                            return
-                        except httpx.HTTPStatusError as retry_e:
-                            last_retry_error = retry_e
-                            if retry_e.response.status_code != 400:
-                                raise
-                    if not retried:
-                        raise last_retry_error
-                if e.response.status_code == 404:
-                    # Model not found on this endpoint, try next
-                    last_error = e
-                    continue
-                last_error = e
+                match e.response.status_code:
+                    case 429:
+                        # Mark rate-limited and let generate() handle rotation
+                        raise
+                    case 401 | 403:
+                        # Auth errors — retrying won't help
+                        raise
+                    case 400:
+                        # Cloud Code 400s can be transient — retry on same endpoint
+                        async for response in self._retry_antigravity_bad_request(
+                            url, headers, request_body, e
+                        ):
+                            yield response
+                        return
+                    case _:
+                        # 404 (model not on this endpoint) and others: try the next one
+                        last_error = e
             except httpx.ConnectError:
                 # Don't overwrite a more informative error from a previous endpoint
                 continue
@@ -313,53 +486,106 @@ class LLM:
             raise last_error
         raise LLMRequestFailedError("All Antigravity endpoints unreachable.")
 
+    async def _retry_antigravity_bad_request(
+        self,
+        url: str,
+        headers: dict[str, str],
+        body: dict[str, Any],
+        error: httpx.HTTPStatusError,
+    ) -> AsyncGenerator[LLMResponse, None]:
+        """Retry a 400 on the same endpoint; re-raise the last error if it persists."""
+        for retry in range(_AG_BAD_REQUEST_RETRIES):
+            await asyncio.sleep(2 * (retry + 1))
+            try:
+                async for response in self._do_antigravity_stream(url, headers, body):
+                    yield response
+                return
+            except httpx.HTTPStatusError as retry_e:
+                if retry_e.response.status_code != 400:
+                    raise
+                error = retry_e
+        raise error
+
+    async def _race_antigravity_endpoints(
+        self,
+        urls: list[str],
+        headers: dict[str, str],
+        body: dict[str, Any],
+    ) -> tuple[AsyncGenerator[LLMResponse, None], LLMResponse] | dict[str, BaseException]:
+        """Start a stream on every endpoint and keep the first one to produce a response.
+
+        Returns the winning stream and its first response, or each endpoint's
+        exception keyed by URL if all of them fail.
+        """
+        streams = {url: self._do_antigravity_stream(url, headers, body) for url in urls}
+        task_urls = {asyncio.ensure_future(anext(stream)): url for url, stream in streams.items()}
+        tasks = {task: streams[url] for task, url in task_urls.items()}
+        pending = set(tasks)
+        winner: asyncio.Future[LLMResponse] | None = None
+        try:
+            while pending and winner is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None and winner is None:
+                        winner = task
+        finally:
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            for task, stream in tasks.items():
+                if task is not winner:
+                    await stream.aclose()
+
+        if winner is None:
+            return {url: task.exception() for task, url in task_urls.items()}
+        return tasks[winner], winner.result()
+
     async def _do_antigravity_stream(
         self,
         url: str,
         headers: dict[str, str],
         body: dict[str, Any],
-    ) -> AsyncIterator[LLMResponse]:
+    ) -> AsyncGenerator[LLMResponse, None]:
         """Execute a single SSE stream against the Cloud Code API."""
-        accumulated = ""
+        buffer = StreamAccumulator()
         all_thinking: list[dict[str, Any]] = []
         all_tool_calls: list[dict[str, Any]] = []
         total_usage: dict[str, int] = {}
         done_streaming = False
 
-        async with httpx.AsyncClient(timeout=120) as http:
-            async with http.stream("POST", url, headers=headers, json=body) as resp:
-                resp.raise_for_status()
-                async for line in resp.aiter_lines():
-                    if done_streaming:
-                        break
-
-                    if line.startswith("data: "):
-                        data_str = line[6:]
-                        if data_str.strip() == "[DONE]":
-                            break
-                        try:
-                            chunk = json.loads(data_str)
-                        except json.JSONDecodeError:
-                            continue
-
-                        text, thinking, tool_calls, usage = parse_sse_chunk(chunk)
-                        if thinking:
-                            all_thinking.extend(thinking)
-                        if tool_calls:
-                            all_tool_calls.extend(tool_calls)
-                        if usage:
-                            total_usage = usage
-
-                        if text:
-                            accumulated += text
-                            if "</function>" in accumulated:
-                                accumulated = accumulated[
-                                    : accumulated.find("</function>") + len("</function>")
-                                ]
-                                yield LLMResponse(content=accumulated)
-                                done_streaming = True
-                                continue
-                            yield LLMResponse(content=accumulated)
+        http = _get_antigravity_client()
+        async with http.stream("POST", url, headers=headers, json=body) as resp:
+            resp.raise_for_status()
+            async for data in aiter_sse_data(resp.aiter_bytes()):
+                if done_streaming:
+                    break
+
+                payload = data.strip()
+                if payload == b"[DONE]":
+                    break
+                # Keep-alives and other non-JSON frames never reach the parser.
+                if payload[:1] not in (b"{", b"["):
+                    continue
+                try:
+                    chunk = fast_json.loads(payload)
+                except (fast_json.JSONDecodeError, UnicodeDecodeError):
+                    continue
+
+                text, thinking, tool_calls, usage = parse_sse_chunk(chunk)
+                if thinking:
+                    all_thinking.extend(thinking)
+                if tool_calls:
+                    all_tool_calls.extend(tool_calls)
+                if usage:
+                    total_usage = usage
+
+                if text:
+                    if buffer.add(text):
+                        yield LLMResponse(content=buffer.text)
+                        done_streaming = True
+                        continue
+                    if buffer.should_emit():
+                        yield LLMResponse(content=buffer.text)
 
         # Update usage stats
         if total_usage:
@@ -372,13 +598,11 @@ class LLM:
             self._total_stats.last_input_tokens = req_input
 
             # Calculate cost via pricing DB
-            from esprit.llm.pricing import get_pricing_db
-
             self._total_stats.cost += get_pricing_db().get_cost(
                 self.config.model_name or "", req_input, req_output, req_cached,
             )
 
-        accumulated = fix_incomplete_tool_call(_truncate_to_first_function(accumulated))
+        accumulated = fix_incomplete_tool_call(_truncate_to_first_function(buffer.text))
         yield LLMResponse(
             content=accumulated,
             tool_invocations=parse_tool_invocations(accumulated),
@@ -386,26 +610,19 @@ class LLM:
         )
 
     def _prepare_messages(self, conversation_history: list[dict[str, Any]]) -> list[dict[str, Any]]:
-        messages = [{"role": "system", "content": self.system_prompt}]
-
-        if self.agent_name:
-            messages.append(
-                {
-                    "role": "user",
-                    "content": (
-                        f"\n\n<agent_identity>\n"
-                        f"<meta>Internal metadata: do not echo or reference.</meta>\n"
-                        f"<agent_name>{self.agent_name}</agent_name>\n"
-                        f"<agent_id>{self.agent_id}</agent_id>\n"
-                        f"</agent_identity>\n\n"
-                    ),
-                }
-            )
-
-        compressed = list(self._compress_with_tracer_signal(conversation_history))
-        conversation_history.clear()
-        conversation_history.extend(compressed)
-        messages.extend(compressed)
+        fingerprint = _history_fingerprint(conversation_history)
+        # An unchanged fingerprint means no new turn: the history is already compressed.
+        if fingerprint is None or fingerprint != self._last_compress_fingerprint:
+            compressed = self._compress_with_tracer_signal(conversation_history)
+            if compressed is not conversation_history:
+                conversation_history[:] = compressed
+            self._last_compress_fingerprint = _history_fingerprint(conversation_history)
+
+        # Shared dicts: downstream rewrites (_strip_images, _add_cache_control) copy, never mutate.
+        if self._identity_msg is None:
+            messages = [self._system_msg, *conversation_history]
+        else:
+            messages = [self._system_msg, self._identity_msg, *conversation_history]
 
         if self._is_anthropic() and self.config.enable_prompt_caching:
             messages = self._add_cache_control(messages)
@@ -416,8 +633,6 @@ class LLM:
         self, conversation_history: list[dict[str, Any]]
     ) -> list[dict[str, Any]]:
         """Run memory compression, signalling the tracer so the TUI can show progress."""
-        from esprit.telemetry.tracer import get_global_tracer
-
         tracer = get_global_tracer()
         agent_id = self.agent_id
         if tracer and agent_id:
@@ -440,23 +655,20 @@ class LLM:
         }
 
         # Translate google/ → gemini/ for litellm compatibility
-        if self.config.model_name and self.config.model_name.lower().startswith("google/"):
-            args["model"] = "gemini/" + self.config.model_name.split("/", 1)[1]
+        if self._model_lower.startswith("google/"):
+            args["model"] = "gemini/" + self._model_bare
 
         # Check for provider OAuth authentication first (Codex, Copilot, Gemini, etc.)
         use_oauth = False
         if PROVIDERS_AVAILABLE and self.config.model_name:
             use_oauth = should_use_oauth(self.config.model_name)
             if use_oauth:
-                model_lower = self.config.model_name.lower()
-
                 # Codex models use OpenAI's Responses API (mode=responses
                 # in model_cost).  Route through the standard openai provider
                 # with Esprit's OAuth token — avoids litellm's chatgpt/
                 # provider which has auth-file bugs with external tokens.
-                if "codex" in model_lower:
-                    bare_model = self.config.model_name.split("/", 1)[-1]
-                    args["model"] = bare_model
+                if "codex" in self._model_lower:
+                    args["model"] = self._model_bare
                     args["api_key"] = get_provider_api_key(self.config.model_name) or "oauth-auth"
                 else:
                     provider_headers = get_provider_headers(self.config.model_name)
@@ -486,27 +698,30 @@ class LLM:
             return getattr(chunk.choices[0].delta, "content", "") or ""
         return ""
 
-    def _extract_thinking(self, chunks: list[Any]) -> list[dict[str, Any]] | None:
-        if not chunks or not self._supports_reasoning():
-            return None
+    def _estimate_usage(self, messages: list[dict[str, Any]], completion: str) -> Any:
+        """Estimate usage with litellm's tokenizer when the stream reported none."""
+        model = self.config.model_name or ""
         try:
-            resp = stream_chunk_builder(chunks)
-            if resp.choices and hasattr(resp.choices[0].message, "thinking_blocks"):
-                blocks: list[dict[str, Any]] = resp.choices[0].message.thinking_blocks
-                return blocks
-        except Exception:  # noqa: BLE001, S110  # nosec B110
-            pass
-        return None
+            prompt_tokens = litellm.token_counter(model=model, messages=messages)
+            completion_tokens = litellm.token_counter(model=model, text=completion)
+        except Exception:
+            logger.debug("Could not estimate token usage for %s", model, exc_info=True)
+            return None
+        return litellm.Usage(
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            total_tokens=prompt_tokens + completion_tokens,
+        )
 
-    def _update_usage_stats(self, response: Any) -> None:
+    def _update_usage_stats(self, usage: Any) -> None:
         try:
-            if hasattr(response, "usage") and response.usage:
-                input_tokens = getattr(response.usage, "prompt_tokens", 0)
-                output_tokens = getattr(response.usage, "completion_tokens", 0)
+            if usage:
+                input_tokens = getattr(usage, "prompt_tokens", 0)
+                output_tokens = getattr(usage, "completion_tokens", 0)
 
                 cached_tokens = 0
-                if hasattr(response.usage, "prompt_tokens_details"):
-                    prompt_details = response.usage.prompt_tokens_details
+                if hasattr(usage, "prompt_tokens_details"):
+                    prompt_details = usage.prompt_tokens_details
                     if hasattr(prompt_details, "cached_tokens"):
                         cached_tokens = prompt_details.cached_tokens or 0
 
@@ -516,8 +731,6 @@ class LLM:
                 cached_tokens = 0
 
             # Calculate cost via our pricing DB (covers all providers)
-            from esprit.llm.pricing import get_pricing_db
-
             cost = get_pricing_db().get_cost(
                 self.config.model_name or "",
                 input_tokens,
@@ -541,31 +754,29 @@ class LLM:
         return code is None or litellm._should_retry(code)
 
     def _raise_error(self, e: Exception) -> None:
-        from esprit.telemetry import posthog
-
         posthog.error("llm_error", type(e).__name__)
         raise LLMRequestFailedError(f"LLM request failed: {type(e).__name__}", str(e)) from e
 
     def _is_anthropic(self) -> bool:
-        if not self.config.model_name:
-            return False
-        return any(p in self.config.model_name.lower() for p in ["anthropic/", "claude"])
+        if self._anthropic_flag is None:
+            self._anthropic_flag = any(p in self._model_lower for p in ["anthropic/", "claude"])
+        return self._anthropic_flag
 
     def _is_antigravity(self) -> bool:
+        if self._antigravity_flag is None:
+            self._antigravity_flag = self._detect_antigravity()
+        return self._antigravity_flag
+
+    def _detect_antigravity(self) -> bool:
         if not PROVIDERS_AVAILABLE or not self.config.model_name:
             return False
-        model = self.config.model_name.lower()
-        if model.startswith("antigravity/"):
+        if self._model_lower.startswith("antigravity/"):
             return True
         # If an explicit non-antigravity provider prefix is given, respect it
-        if "/" in model:
-            prefix = model.split("/", 1)[0]
-            _NON_AG_PREFIXES = {"anthropic", "google", "openai", "bedrock",
-                                "github-copilot", "gemini", "azure", "vertex_ai"}
-            if prefix in _NON_AG_PREFIXES:
-                return False
+        if self._model_prefix.lower() in _NON_AG_PREFIXES:
+            return False
         # Check if the bare model name is an antigravity model and oauth is configured
-        bare = model.split("/", 1)[-1]
+        bare = self._model_bare.lower()
         if bare in ANTIGRAVITY_MODELS and should_use_oauth(f"antigravity/{bare}"):
             return True
         return False
@@ -596,7 +807,7 @@ class LLM:
         if not current:
             return False
 
-        bare_model = model.split("/", 1)[-1]
+        bare_model = self._model_bare
         # Parse retry-after header if available
         retry_after = 60.0
         resp = getattr(e, "response", None)
@@ -630,8 +841,6 @@ class LLM:
         if not PROVIDERS_AVAILABLE:
             return False
 
-        from esprit.providers.antigravity import get_fallback_models
-
         current_model = self.config.model_name or ""
         fallbacks = get_fallback_models(current_model)
 
@@ -643,7 +852,7 @@ class LLM:
             self._original_model = current_model
         if not hasattr(self, "_tried_models"):
             self._tried_models: set[str] = set()
-        self._tried_models.add(current_model.split("/", 1)[-1] if "/" in current_model else current_model)
+        self._tried_models.add(self._model_bare)
 
         for fallback in fallbacks:
             if fallback in self._tried_models:
@@ -653,9 +862,10 @@ class LLM:
             # active model for the remainder of this LLM instance's lifetime
             # to avoid repeated failures on the original model.
             old_model = current_model
-            prefix = current_model.split("/", 1)[0] + "/" if "/" in current_model else "antigravity/"
+            prefix = f"{self._model_prefix}/" if self._model_prefix else "antigravity/"
             new_model = f"{prefix}{fallback}"
             self.config.model_name = new_model
+            self._recompute_model_parts()
             self._tried_models.add(fallback)
 
             logger.warning(
@@ -667,18 +877,15 @@ class LLM:
         return False
 
     def _supports_vision(self) -> bool:
-        try:
-            return bool(supports_vision(model=self.config.model_name))
-        except Exception:  # noqa: BLE001
-            return False
+        return _model_supports_vision(self.config.model_name)
 
     def _supports_reasoning(self) -> bool:
-        try:
-            return bool(supports_reasoning(model=self.config.model_name))
-        except Exception:  # noqa: BLE001
-            return False
+        return _model_supports_reasoning(self.config.model_name)
 
     def _strip_images(self, messages: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        if not any(_has_image_part(msg.get("content")) for msg in messages):
+            return messages
+
         result = []
         for msg in messages:
             content = msg.get("content")
@@ -695,7 +902,7 @@ class LLM:
         return result
 
     def _add_cache_control(self, messages: list[dict[str, Any]]) -> list[dict[str, Any]]:
-        if not messages or not supports_prompt_caching(self.config.model_name):
+        if not messages or not _model_supports_prompt_caching(self.config.model_name):
             return messages
 
         result = list(messages)
@@ -710,4 +917,21 @@ class LLM:
                 if isinstance(content, str)
                 else content,
             }
+
+        # Also mark the newest turn so the next request can reuse the whole
+        # conversation prefix, not just the system prompt.
+        last = result[-1]
+        content = last.get("content")
+        if (
+            len(result) > 1
+            and last.get("role") in ("user", "assistant")
+            and isinstance(content, str)
+            and content
+        ):
+            result[-1] = {
+                **last,
+                "content": [
+                    {"type": "text", "text": content, "cache_control": {"type": "ephemeral"}}
+                ],
+            }
         return result
@@ -5,13 +5,18 @@ with fallback to the bundled litellm.model_cost dict. Supports tiered
 pricing (e.g. Claude's 200k-token threshold) and cache token costing.
 """
 
+import contextlib
 import json
 import logging
-import os
 import threading
 import time
 from pathlib import Path
-from typing import Any
+from typing import Any, NamedTuple
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+from esprit.config import Config
+from esprit.utils.atomic_write import atomic_write_json
 
 logger = logging.getLogger(__name__)
 
@@ -20,6 +25,13 @@ LITELLM_PRICING_URL = (
     "model_prices_and_context_window.json"
 )
 
+# Last successful remote fetch (pricing rows plus HTTP validators), so warm
+# starts can revalidate with a conditional GET instead of re-downloading.
+_REMOTE_CACHE_FILE = Path.home() / ".esprit" / "pricing_cache.json"
+_REMOTE_CACHE_MAX_AGE_S = 7 * 24 * 3600
+# A cached copy younger than this is used as is, without contacting the server.
+_REMOTE_REFRESH_INTERVAL_S = 24 * 3600
+
 # Tiered pricing threshold (Claude charges more above this)
 _TIERED_THRESHOLD = 200_000
 
@@ -68,35 +80,127 @@ _PRICING_FIELDS = {
 }
 
 
-class ModelPricing:
+class ModelPricing(NamedTuple):
     """Per-token pricing for a single model."""
 
-    __slots__ = (
-        "input_cost",
-        "output_cost",
-        "cache_write_cost",
-        "cache_read_cost",
-        "input_cost_above",
-        "output_cost_above",
-        "cache_write_cost_above",
-        "cache_read_cost_above",
-        "max_input_tokens",
-    )
-
-    def __init__(self, data: dict[str, Any]) -> None:
-        self.input_cost: float = data.get("input_cost_per_token") or 0.0
-        self.output_cost: float = data.get("output_cost_per_token") or 0.0
-        self.cache_write_cost: float = data.get("cache_creation_input_token_cost") or 0.0
-        self.cache_read_cost: float = data.get("cache_read_input_token_cost") or 0.0
-        self.input_cost_above: float = data.get("input_cost_per_token_above_200k_tokens") or 0.0
-        self.output_cost_above: float = data.get("output_cost_per_token_above_200k_tokens") or 0.0
-        self.cache_write_cost_above: float = (
-            data.get("cache_creation_input_token_cost_above_200k_tokens") or 0.0
+    input_cost: float = 0.0
+    output_cost: float = 0.0
+    cache_write_cost: float = 0.0
+    cache_read_cost: float = 0.0
+    input_cost_above: float = 0.0
+    output_cost_above: float = 0.0
+    cache_write_cost_above: float = 0.0
+    cache_read_cost_above: float = 0.0
+    max_input_tokens: int = 0
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> "ModelPricing":
+        """Build from a LiteLLM pricing row; missing or null fields become zero."""
+        get = data.get
+        return cls(
+            get("input_cost_per_token") or 0.0,
+            get("output_cost_per_token") or 0.0,
+            get("cache_creation_input_token_cost") or 0.0,
+            get("cache_read_input_token_cost") or 0.0,
+            get("input_cost_per_token_above_200k_tokens") or 0.0,
+            get("output_cost_per_token_above_200k_tokens") or 0.0,
+            get("cache_creation_input_token_cost_above_200k_tokens") or 0.0,
+            get("cache_read_input_token_cost_above_200k_tokens") or 0.0,
+            get("max_input_tokens") or 0,
         )
-        self.cache_read_cost_above: float = (
-            data.get("cache_read_input_token_cost_above_200k_tokens") or 0.0
-        )
-        self.max_input_tokens: int = data.get("max_input_tokens") or 0
+
+
+def _parse_rows(rows: dict[str, Any]) -> dict[str, ModelPricing]:
+    """Build pricing entries for usable rows, sharing one object per distinct price set.
+
+    Many aliases (dated snapshots, provider-prefixed copies) carry identical prices.
+    """
+    parsed: dict[str, ModelPricing] = {}
+    seen: dict[ModelPricing, ModelPricing] = {}
+    for name, info in rows.items():
+        if isinstance(info, dict) and info.get("input_cost_per_token"):
+            pricing = ModelPricing.from_dict(info)
+            parsed[name] = seen.setdefault(pricing, pricing)
+    return parsed
+
+
+# Characters that may follow a matched model-name prefix ("-", ".", ":" or an ASCII digit).
+_BOUNDARY_CHARS = frozenset("-.:0123456789")
+
+
+class _TrieNode:
+    """Character trie node over lowercased bare model names.
+
+    ``entry`` is the earliest-loaded key ending at this node and ``first`` the
+    earliest-loaded key anywhere in its subtree, both as ``(order, pricing)``.
+    """
+
+    __slots__ = ("children", "entry", "first")
+
+    def __init__(self) -> None:
+        self.children: dict[str, _TrieNode] = {}
+        self.entry: tuple[int, ModelPricing] | None = None
+        self.first: tuple[int, ModelPricing] | None = None
+
+
+def _build_trie(data: dict[str, ModelPricing]) -> _TrieNode:
+    root = _TrieNode()
+    # Orders only increase, so the first value stored on a node is its earliest.
+    for order, (key, pricing) in enumerate(data.items()):
+        key_bare = key.split("/", 1)[-1].lower()
+        if not key_bare:
+            continue
+        node = root
+        for char in key_bare:
+            child = node.children.get(char)
+            if child is None:
+                child = node.children[char] = _TrieNode()
+            node = child
+            if node.first is None:
+                node.first = (order, pricing)
+        if node.entry is None:
+            node.entry = (order, pricing)
+    return root
+
+
+def _build_prefix_hits(data: dict[str, ModelPricing]) -> dict[str, ModelPricing]:
+    """Map each name reachable through ``_PROVIDER_PREFIXES`` to its entry.
+
+    Earlier prefixes win, matching the order the prefixes used to be tried in.
+    """
+    hits: dict[str, ModelPricing] = {}
+    for prefix in _PROVIDER_PREFIXES:
+        for key, pricing in data.items():
+            if key.startswith(prefix):
+                hits.setdefault(key[len(prefix) :], pricing)
+    return hits
+
+
+def _fuzzy_lookup(root: _TrieNode, name: str) -> ModelPricing | None:
+    """Boundary-aware prefix match of ``name`` (lowercased) against the trie.
+
+    A key that equals or extends ``name`` on a boundary wins (earliest-loaded
+    first); otherwise the longest key that is a boundary prefix of ``name``.
+    """
+    longest: ModelPricing | None = None
+    node = root
+    for pos, char in enumerate(name, 1):
+        next_node = node.children.get(char)
+        if next_node is None:
+            return longest
+        node = next_node
+        if node.entry is not None and (pos == len(name) or name[pos] in _BOUNDARY_CHARS):
+            longest = node.entry[1]
+
+    extending = [node.entry] if node.entry is not None else []
+    extending.extend(
+        child.first
+        for char, child in node.children.items()
+        if child.first is not None and char in _BOUNDARY_CHARS
+    )
+    if extending:
+        return min(extending, key=lambda entry: entry[0])[1]
+    return longest
 
 
 def _tiered_cost(
@@ -129,6 +233,14 @@ def calculate_cost(
     # Cache-read tokens are a subset of input tokens already counted
     regular_input = max(0, input_tokens - cached_tokens)
 
+    # Common case: nothing crosses the tier threshold, so only base rates apply.
+    if max(regular_input, output_tokens, cached_tokens) <= _TIERED_THRESHOLD:
+        return (
+            regular_input * pricing.input_cost
+            + max(0, output_tokens) * pricing.output_cost
+            + max(0, cached_tokens) * pricing.cache_read_cost
+        )
+
     input_cost = _tiered_cost(regular_input, pricing.input_cost, pricing.input_cost_above)
     output_cost = _tiered_cost(output_tokens, pricing.output_cost, pricing.output_cost_above)
     cache_read = _tiered_cost(cached_tokens, pricing.cache_read_cost, pricing.cache_read_cost_above)
@@ -144,43 +256,80 @@ class PricingDB:
         self._loaded = False
         self._lock = threading.Lock()
         self._fetch_attempted = False
+        # Resolved lookups (misses included); cleared whenever pricing rows change.
+        self._resolve_cache: dict[str, ModelPricing | None] = {}
+        self._trie = _TrieNode()
+        self._prefix_hits: dict[str, ModelPricing] = {}
+        # Bumped whenever pricing rows change so callers can key caches on it.
+        self.data_version = 0
 
     def _load_bundled(self) -> None:
         """Load from litellm's bundled model_cost as baseline."""
         try:
             import litellm
 
-            for name, info in litellm.model_cost.items():
-                if isinstance(info, dict) and info.get("input_cost_per_token"):
-                    self._data[name] = ModelPricing(info)
+            self._data.update(_parse_rows(litellm.model_cost))
             self._loaded = True
+            self._rebuild_index()
+            self.data_version += 1
             logger.debug("Loaded %d models from bundled litellm.model_cost", len(self._data))
         except Exception:
             logger.debug("Failed to load bundled litellm pricing")
 
+    def _apply_rows(self, rows: dict[str, Any]) -> int:
+        """Merge raw pricing rows into the DB; returns how many were usable."""
+        updates = _parse_rows(rows)
+        with self._lock:
+            self._data.update(updates)
+            self._rebuild_index()
+            self.data_version += 1
+        return len(updates)
+
     def _fetch_remote(self) -> None:
-        """Fetch latest pricing from LiteLLM's GitHub repo."""
+        """Fetch latest pricing from LiteLLM's GitHub repo.
+
+        The previous response is replayed from disk first and revalidated with
+        ``If-None-Match`` / ``If-Modified-Since``; a 304 keeps it as is.
+        """
         if self._fetch_attempted:
             return
         self._fetch_attempted = True
         try:
-            from urllib.request import urlopen, Request
-
-            req = Request(LITELLM_PRICING_URL, headers={"User-Agent": "esprit"})
-            with urlopen(req, timeout=10) as resp:
-                raw: dict[str, Any] = json.loads(resp.read())
-            updates: dict[str, ModelPricing] = {}
-            count = 0
-            for name, info in raw.items():
-                if isinstance(info, dict) and info.get("input_cost_per_token"):
-                    updates[name] = ModelPricing(info)
-                    count += 1
-            with self._lock:
-                self._data.update(updates)
+            cached = _read_remote_cache()
+            headers = {"User-Agent": "esprit"}
+            if cached:
+                self._apply_rows(cached["models"])
+                if cached.get("etag"):
+                    headers["If-None-Match"] = cached["etag"]
+                if cached.get("last_modified"):
+                    headers["If-Modified-Since"] = cached["last_modified"]
+
+            req = Request(LITELLM_PRICING_URL, headers=headers)
+            try:
+                with urlopen(req, timeout=10) as resp:
+                    raw: dict[str, Any] = json.loads(resp.read())
+                    etag = resp.headers.get("ETag")
+                    last_modified = resp.headers.get("Last-Modified")
+            except HTTPError as e:
+                if e.code == 304 and cached:
+                    # Still current: refresh the cache's age instead of rewriting it.
+                    with contextlib.suppress(OSError):
+                        _REMOTE_CACHE_FILE.touch()
+                    logger.debug("Remote pricing unchanged, using cached copy")
+                    return
+                raise
+            count = self._apply_rows(raw)
+            _write_remote_cache(raw, etag, last_modified)
             logger.debug("Fetched %d models from LiteLLM remote pricing", count)
         except Exception:
             logger.debug("Failed to fetch remote pricing, using bundled data")
 
+    def _rebuild_index(self) -> None:
+        """Refresh derived lookup structures after ``_data`` changes (caller holds the lock)."""
+        self._trie = _build_trie(self._data)
+        self._prefix_hits = _build_prefix_hits(self._data)
+        self._resolve_cache.clear()
+
     def ensure_loaded(self) -> None:
         """Load pricing data (bundled first, then remote in background)."""
         if self._loaded:
@@ -189,11 +338,34 @@ class PricingDB:
             if self._loaded:
                 return
             self._load_bundled()
-            # Fetch remote in background to get latest prices without blocking
-            t = threading.Thread(target=self._fetch_remote, daemon=True)
-            t.start()
-
-    def _resolve_model(self, model: str, _seen: set[str] | None = None) -> ModelPricing | None:
+            refresh = _remote_refresh_due()
+            if refresh:
+                # Fetch remote in background to get latest prices without blocking
+                t = threading.Thread(target=self._fetch_remote, daemon=True)
+                t.start()
+        if not refresh:
+            # Offline or recently fetched: replay the cached copy, no network round-trip.
+            self._fetch_attempted = True
+            cached = _read_remote_cache()
+            if cached:
+                self._apply_rows(cached["models"])
+
+    def _resolve_model(self, model: str) -> ModelPricing | None:
+        """Resolve a model name to its pricing entry, memoizing the result."""
+        try:
+            return self._resolve_cache[model]
+        except KeyError:
+            pass
+        version = self.data_version
+        pricing = self._resolve_uncached(model)
+        # Don't memoize a result computed against rows that changed meanwhile.
+        if version == self.data_version:
+            self._resolve_cache[model] = pricing
+        return pricing
+
+    def _resolve_uncached(
+        self, model: str, _seen: set[str] | None = None
+    ) -> ModelPricing | None:
         """Resolve a model name to its pricing entry."""
         # Strip provider prefix for bare name
         bare = model.split("/", 1)[-1] if "/" in model else model
@@ -204,10 +376,9 @@ class PricingDB:
                 return self._data[candidate]
 
         # Try with provider prefixes
-        for prefix in _PROVIDER_PREFIXES:
-            key = f"{prefix}{bare}"
-            if key in self._data:
-                return self._data[key]
+        hit = self._prefix_hits.get(bare)
+        if hit is not None:
+            return hit
 
         # Try alias (with cycle guard)
         alias = _MODEL_ALIASES.get(bare)
@@ -216,30 +387,14 @@ class PricingDB:
                 _seen = set()
             if alias not in _seen:
                 _seen.add(alias)
-                return self._resolve_model(alias, _seen)
+                return self._resolve_uncached(alias, _seen)
 
-        # Fuzzy: longest-prefix match (e.g. "claude-sonnet-4-5-20250514" matches "claude-sonnet-4-5")
+        # Fuzzy: match on a boundary, either way round (e.g. "claude-sonnet-4-5-20250514"
+        # matches "claude-sonnet-4-5"; "gemini-3-flash" matches "gemini-3-flash-preview").
         bare_lower = bare.lower()
-        best: ModelPricing | None = None
-        best_len = 0
-        for key, pricing in list(self._data.items()):
-            key_bare = key.split("/", 1)[-1].lower() if "/" in key else key.lower()
-            # Model name must start with the DB key (or vice versa) on a boundary
-            if bare_lower.startswith(key_bare) and len(key_bare) > best_len:
-                # Ensure match is on a boundary (end, or followed by dash/digit)
-                rest = bare_lower[len(key_bare):]
-                if not rest or rest[0] in ("-", ".", ":") or rest[0].isdigit():
-                    best = pricing
-                    best_len = len(key_bare)
-            elif key_bare.startswith(bare_lower) and len(bare_lower) > best_len:
-                rest = key_bare[len(bare_lower):]
-                if not rest or rest[0] in ("-", ".", ":") or rest[0].isdigit():
-                    best = pricing
-                    best_len = len(bare_lower)
-        if best is not None:
-            return best
-
-        return None
+        if not bare_lower:
+            return None
+        return _fuzzy_lookup(self._trie, bare_lower)
 
     def get_pricing(self, model: str) -> ModelPricing | None:
         """Get pricing for a model name. Returns None if not found."""
@@ -282,29 +437,90 @@ def get_pricing_db() -> PricingDB:
     return _db
 
 
+def _remote_refresh_due() -> bool:
+    """Whether to contact the pricing server: not offline and no cache from the last day."""
+    if Config.get_bool("esprit_offline"):
+        return False
+    try:
+        age = time.time() - _REMOTE_CACHE_FILE.stat().st_mtime
+    except OSError:
+        return True
+    return age >= _REMOTE_REFRESH_INTERVAL_S
+
+
+def _read_remote_cache() -> dict[str, Any] | None:
+    try:
+        if time.time() - _REMOTE_CACHE_FILE.stat().st_mtime > _REMOTE_CACHE_MAX_AGE_S:
+            return None
+        cached = json.loads(_REMOTE_CACHE_FILE.read_text(encoding="utf-8"))
+    except (json.JSONDecodeError, OSError):
+        return None
+    if not isinstance(cached, dict) or not isinstance(cached.get("models"), dict):
+        return None
+    return cached
+
+
+def _write_remote_cache(
+    rows: dict[str, Any], etag: str | None, last_modified: str | None
+) -> None:
+    """Persist only the priced rows and fields we read, plus the response validators."""
+    models = {
+        name: {k: v for k, v in info.items() if k in _PRICING_FIELDS}
+        for name, info in rows.items()
+        if isinstance(info, dict) and info.get("input_cost_per_token")
+    }
+    payload = {"etag": etag, "last_modified": last_modified, "models": models}
+    try:
+        atomic_write_json(_REMOTE_CACHE_FILE, payload, private=False)
+    except OSError:
+        logger.debug("Failed to write remote pricing cache")
+
+
 # ---------------------------------------------------------------------------
 # Lifetime cost tracking — persisted in ~/.esprit/usage.json
 # ---------------------------------------------------------------------------
 
 _USAGE_FILE = Path.home() / ".esprit" / "usage.json"
 
+# (file key, parsed contents) of the last read or write; the stats panel polls
+# get_lifetime_cost() on every refresh, so only re-parse after a write.
+_usage_cache: tuple[tuple[int, int, int], dict[str, Any]] | None = None
+
+
+def _usage_file_key() -> tuple[int, int, int]:
+    # mtime alone can repeat within one timestamp tick; atomic_write_json replaces
+    # the inode on every write, so include it and the size.
+    st = _USAGE_FILE.stat()
+    return st.st_ino, st.st_mtime_ns, st.st_size
+
 
 def _read_usage() -> dict[str, Any]:
+    global _usage_cache  # noqa: PLW0603
+    try:
+        key = _usage_file_key()
+    except OSError:
+        return {}
+    cached = _usage_cache
+    if cached is not None and cached[0] == key:
+        return dict(cached[1])
     try:
-        if _USAGE_FILE.exists():
-            return json.loads(_USAGE_FILE.read_text(encoding="utf-8"))
+        data = json.loads(_USAGE_FILE.read_text(encoding="utf-8"))
     except (json.JSONDecodeError, OSError):
-        pass
-    return {}
+        return {}
+    if not isinstance(data, dict):
+        return {}
+    _usage_cache = (key, data)
+    return dict(data)
 
 
 def _write_usage(data: dict[str, Any]) -> None:
+    global _usage_cache  # noqa: PLW0603
     try:
-        _USAGE_FILE.parent.mkdir(parents=True, exist_ok=True)
-        _USAGE_FILE.write_text(json.dumps(data, indent=2), encoding="utf-8")
-        if os.name != "nt":
-            _USAGE_FILE.chmod(0o600)
+        atomic_write_json(_USAGE_FILE, data)
+        # Cache what was just written so the next read needn't trust timestamps
+        _usage_cache = (_usage_file_key(), dict(data))
     except OSError:
+        _usage_cache = None
         logger.debug("Failed to write usage file")
 
 
@@ -1,18 +1,41 @@
 import html
 import re
+import time
 from typing import Any
 
 
+_FUNCTION_START = "<function="
+_FUNCTION_END = "</function>"
+_FUNCTION_END_LEN = len(_FUNCTION_END)
+
+_FN_PATTERN = re.compile(r"<function=([^>]+)>\n?(.*?)</function>", re.DOTALL)
+_FN_PARAM_PATTERN = re.compile(r"<parameter=([^>]+)>(.*?)</parameter>", re.DOTALL)
+_TOOL_PATTERN = re.compile(r"<function=[^>]+>.*?</function>", re.DOTALL)
+_INCOMPLETE_TOOL_PATTERN = re.compile(r"<function=[^>]+>.*$", re.DOTALL)
+_PARTIAL_TAG_PATTERN = re.compile(
+    r"<f(?:u(?:n(?:c(?:t(?:i(?:o(?:n(?:=(?:[^>]*)?)?)?)?)?)?)?)?)?$"
+)
+_HIDDEN_XML_PATTERNS = tuple(
+    re.compile(pattern, re.DOTALL | re.IGNORECASE)
+    for pattern in (
+        r"<inter_agent_message>.*?</inter_agent_message>",
+        r"<agent_completion_report>.*?</agent_completion_report>",
+    )
+)
+_BLANK_LINES_PATTERN = re.compile(r"\n\s*\n")
+
+
 def _truncate_to_first_function(content: str) -> str:
     if not content:
         return content
 
-    function_starts = [match.start() for match in re.finditer(r"<function=", content)]
-
-    if len(function_starts) >= 2:
-        second_function_start = function_starts[1]
+    first = content.find(_FUNCTION_START)
+    if first == -1:
+        return content
 
-        return content[:second_function_start].rstrip()
+    second = content.find(_FUNCTION_START, first + 1)
+    if second != -1:
+        return content[:second].rstrip()
 
     return content
 
@@ -22,16 +45,13 @@ def parse_tool_invocations(content: str) -> list[dict[str, Any]] | None:
 
     tool_invocations: list[dict[str, Any]] = []
 
-    fn_regex_pattern = r"<function=([^>]+)>\n?(.*?)</function>"
-    fn_param_regex_pattern = r"<parameter=([^>]+)>(.*?)</parameter>"
-
-    fn_matches = re.finditer(fn_regex_pattern, content, re.DOTALL)
+    fn_matches = _FN_PATTERN.finditer(content)
 
     for fn_match in fn_matches:
         fn_name = fn_match.group(1)
         fn_body = fn_match.group(2)
 
-        param_matches = re.finditer(fn_param_regex_pattern, fn_body, re.DOTALL)
+        param_matches = _FN_PARAM_PATTERN.finditer(fn_body)
 
         args = {}
         for param_match in param_matches:
@@ -48,11 +68,7 @@ def parse_tool_invocations(content: str) -> list[dict[str, Any]] | None:
 
 def fix_incomplete_tool_call(content: str) -> str:
     """Fix incomplete tool calls by adding missing </function> tag."""
-    if (
-        "<function=" in content
-        and content.count("<function=") == 1
-        and "</function>" not in content
-    ):
+    if content.count(_FUNCTION_START) == 1 and _FUNCTION_END not in content:
         content = content.rstrip()
         content = content + "function>" if content.endswith("</") else content + "\n</function>"
     return content
@@ -75,22 +91,120 @@ def clean_content(content: str) -> str:
 
     content = fix_incomplete_tool_call(content)
 
-    tool_pattern = r"<function=[^>]+>.*?</function>"
-    cleaned = re.sub(tool_pattern, "", content, flags=re.DOTALL)
+    cleaned = _TOOL_PATTERN.sub("", content)
+    cleaned = _INCOMPLETE_TOOL_PATTERN.sub("", cleaned)
+    cleaned = _PARTIAL_TAG_PATTERN.sub("", cleaned)
 
-    incomplete_tool_pattern = r"<function=[^>]+>.*$"
-    cleaned = re.sub(incomplete_tool_pattern, "", cleaned, flags=re.DOTALL)
+    for pattern in _HIDDEN_XML_PATTERNS:
+        cleaned = pattern.sub("", cleaned)
 
-    partial_tag_pattern = r"<f(?:u(?:n(?:c(?:t(?:i(?:o(?:n(?:=(?:[^>]*)?)?)?)?)?)?)?)?)?$"
-    cleaned = re.sub(partial_tag_pattern, "", cleaned)
+    cleaned = _BLANK_LINES_PATTERN.sub("\n\n", cleaned)
 
-    hidden_xml_patterns = [
-        r"<inter_agent_message>.*?</inter_agent_message>",
-        r"<agent_completion_report>.*?</agent_completion_report>",
-    ]
-    for pattern in hidden_xml_patterns:
-        cleaned = re.sub(pattern, "", cleaned, flags=re.DOTALL | re.IGNORECASE)
+    return cleaned.strip()
 
-    cleaned = re.sub(r"\n\s*\n", "\n\n", cleaned)
 
-    return cleaned.strip()
+# Partial responses are coalesced to roughly 30 updates/s or 64 new characters.
+_EMIT_INTERVAL_S = 0.033
+_EMIT_MIN_CHARS = 64
+
+
+class StreamAccumulator:
+    """Collects streamed text deltas and stops at the first ``</function>``.
+
+    Each delta is searched together with only the last ``len("</function>") - 1``
+    characters seen before it, so detecting the boundary stays linear in the
+    stream length instead of rescanning the whole buffer per chunk.
+    """
+
+    __slots__ = ("_emitted_at", "_emitted_len", "_length", "_parts", "_tail", "done")
+
+    def __init__(self) -> None:
+        self._parts: list[str] = []
+        self._length = 0
+        self._tail = ""
+        self._emitted_at = 0.0
+        self._emitted_len = 0
+        self.done = False
+
+    def add(self, delta: str) -> bool:
+        """Append ``delta``; return True once the closing tag has been reached."""
+        if self.done or not delta:
+            return self.done
+
+        region = self._tail + delta
+        idx = region.find(_FUNCTION_END)
+        if idx == -1:
+            self._parts.append(delta)
+            self._length += len(delta)
+            self._tail = region[-(_FUNCTION_END_LEN - 1) :]
+            return False
+
+        # Keep only the part of this delta up to and including the closing tag.
+        keep = idx + _FUNCTION_END_LEN - len(self._tail)
+        self._parts.append(delta[:keep])
+        self._length += keep
+        self.done = True
+        return True
+
+    def should_emit(self) -> bool:
+        """Whether enough time or text has accrued to publish a partial response."""
+        now = time.monotonic()
+        if (
+            self.done
+            or now - self._emitted_at >= _EMIT_INTERVAL_S
+            or self._length - self._emitted_len >= _EMIT_MIN_CHARS
+        ):
+            self._emitted_at = now
+            self._emitted_len = self._length
+            return True
+        return False
+
+    @property
+    def text(self) -> str:
+        if len(self._parts) > 1:
+            self._parts = ["".join(self._parts)]
+        return self._parts[0] if self._parts else ""
+
+    def __len__(self) -> int:
+        return self._length
+
+
+class ThinkingAccumulator:
+    """Merges streamed ``thinking_blocks`` deltas the way litellm's chunk builder does.
+
+    Thinking text fragments are concatenated into a single ``thinking`` block that
+    carries the last signature seen; ``redacted_thinking`` blocks pass through.
+    """
+
+    __slots__ = ("_blocks", "_signature", "_thinking", "_thinking_parts")
+
+    def __init__(self) -> None:
+        self._blocks: list[dict[str, Any]] = []
+        self._thinking: dict[str, Any] | None = None
+        self._thinking_parts: list[str] = []
+        self._signature: str | None = None
+
+    def add(self, deltas: Any) -> None:
+        if not isinstance(deltas, list):
+            return
+        for block in deltas:
+            if not isinstance(block, dict):
+                continue
+            block_type = block.get("type")
+            if block_type == "redacted_thinking":
+                self._blocks.append(block)
+            elif block_type == "thinking":
+                if self._thinking is None:
+                    self._thinking = {"type": "thinking"}
+                    self._blocks.append(self._thinking)
+                if text := block.get("thinking"):
+                    self._thinking_parts.append(text)
+                if signature := block.get("signature"):
+                    self._signature = signature
+
+    def blocks(self) -> list[dict[str, Any]] | None:
+        if self._thinking is not None:
+            self._thinking["thinking"] = "".join(self._thinking_parts)
+            if self._signature:
+                self._thinking["signature"] = self._signature
+        return self._blocks or None
@@ -5,16 +5,18 @@ Stores multiple OAuth accounts per provider in ~/.esprit/accounts.json.
 Supports sticky (stay until rate-limited) and round-robin strategies.
 """
 
+import atexit
+import heapq
 import json
 import logging
-import os
-import tempfile
+import threading
 import time
 from dataclasses import dataclass, field
 from pathlib import Path
 from typing import Any
 
 from esprit.providers.base import OAuthCredentials
+from esprit.utils.atomic_write import atomic_write_json
 
 logger = logging.getLogger(__name__)
 
@@ -22,6 +24,21 @@ logger = logging.getLogger(__name__)
 BACKOFF_TIERS_S = [60, 300, 1800, 7200]  # 1m, 5m, 30m, 2h
 BACKOFF_RESET_S = 120  # reset counter after 2min of no 429s
 
+# get_best_account only rewrites the pool file for a last_used bump this stale
+LAST_USED_PERSIST_MS = 60_000
+
+# Background saves landing within this window are coalesced into one write
+WRITE_COALESCE_S = 0.1
+
+
+def _now_ms() -> int:
+    """Wall-clock milliseconds as an int.
+
+    Timestamps are persisted and compared across processes, so this stays on
+    the wall clock; ``time_ns`` just avoids the float round-trip.
+    """
+    return time.time_ns() // 1_000_000
+
 
 @dataclass
 class AccountEntry:
@@ -46,6 +63,16 @@ class AccountPool:
         self.config_dir = config_dir or Path.home() / ".esprit"
         self.accounts_file = self.config_dir / "accounts.json"
         self._pools: dict[str, dict[str, Any]] | None = None
+        # Deserialized accounts per provider, kept in sync by _save_accounts
+        self._parsed: dict[str, list[AccountEntry]] = {}
+        # Per-provider min-heap of (reset_at_ms, email, model) rate-limit expiries
+        self._expiry_heaps: dict[str, list[tuple[int, str, str]]] = {}
+        # Latest snapshot awaiting the background writer (see _schedule_save)
+        self._pending: dict[str, dict[str, Any]] | None = None
+        self._pending_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._write_event = threading.Event()
+        self._writer: threading.Thread | None = None
 
     # ── persistence ──────────────────────────────────────────────
 
@@ -63,25 +90,52 @@ class AccountPool:
             self._pools = {}
         return self._pools
 
+    def _snapshot(self) -> dict[str, dict[str, Any]]:
+        # Copy down to the account dicts so later mutations don't race the writer
+        # thread; _account_to_dict already copies the nested rate_limits/extra
+        return {
+            provider_id: {**pool, "accounts": [dict(a) for a in pool.get("accounts", [])]}
+            for provider_id, pool in self._load().items()
+        }
+
     def _save(self) -> None:
-        self.config_dir.mkdir(parents=True, exist_ok=True)
-        data = {"version": 1, "pools": self._load()}
-        # Atomic write: temp file + rename to prevent corruption on crash
-        fd, tmp_path = tempfile.mkstemp(
-            dir=str(self.config_dir), suffix=".tmp", prefix="accounts_"
-        )
-        try:
-            with os.fdopen(fd, "w", encoding="utf-8") as f:
-                json.dump(data, f, indent=2)
-            if os.name != "nt":
-                os.chmod(tmp_path, 0o600)
-            os.replace(tmp_path, str(self.accounts_file))
-        except BaseException:
+        """Write the pool to disk now, superseding any queued background save."""
+        with self._pending_lock:
+            self._pending = self._snapshot()
+        self.flush()
+
+    def _schedule_save(self) -> None:
+        """Queue a save for the background writer; callers don't wait on disk I/O."""
+        with self._pending_lock:
+            self._pending = self._snapshot()
+            if self._writer is None or not self._writer.is_alive():
+                self._writer = threading.Thread(
+                    target=self._write_loop, name="account-pool-writer", daemon=True
+                )
+                self._writer.start()
+                atexit.register(self.flush)
+        self._write_event.set()
+
+    def _write_loop(self) -> None:
+        while True:
+            self._write_event.wait()
+            time.sleep(WRITE_COALESCE_S)
             try:
-                os.unlink(tmp_path)
-            except OSError:
-                pass
-            raise
+                self.flush()
+            except Exception:
+                # Keep the writer alive so later saves still reach the disk
+                logger.warning("Failed to save account pool", exc_info=True)
+
+    def flush(self) -> None:
+        """Write any queued pool state to disk."""
+        # Take and write under one lock so an older snapshot never lands last
+        with self._flush_lock:
+            with self._pending_lock:
+                snapshot, self._pending = self._pending, None
+                self._write_event.clear()
+            if snapshot is not None:
+                # Atomic write: temp file + rename to prevent corruption on crash
+                atomic_write_json(self.accounts_file, {"version": 1, "pools": snapshot})
 
     def _get_pool(self, provider_id: str) -> dict[str, Any]:
         pools = self._load()
@@ -110,7 +164,7 @@ class AccountPool:
             if creds.enterprise_url:
                 creds_data["enterpriseUrl"] = creds.enterprise_url
             if creds.extra:
-                creds_data["extra"] = creds.extra
+                creds_data["extra"] = dict(creds.extra)
         elif creds.type == "api":
             creds_data["key"] = creds.access_token
         return {
@@ -120,7 +174,7 @@ class AccountPool:
             "enabled": acct.enabled,
             "added_at": acct.added_at,
             "last_used": acct.last_used,
-            "rate_limits": acct.rate_limits,
+            "rate_limits": dict(acct.rate_limits),
             "cooling_until": acct.cooling_until,
             "consecutive_429s": acct.consecutive_429s,
             "last_429_at": acct.last_429_at,
@@ -158,13 +212,37 @@ class AccountPool:
         )
 
     def _load_accounts(self, provider_id: str) -> list[AccountEntry]:
-        pool = self._get_pool(provider_id)
-        return [self._dict_to_account(a) for a in pool.get("accounts", [])]
+        parsed = self._parsed.get(provider_id)
+        if parsed is None:
+            pool = self._get_pool(provider_id)
+            parsed = [self._dict_to_account(a) for a in pool.get("accounts", [])]
+            self._parsed[provider_id] = parsed
+            heap = [
+                (reset_at, acct.email, model)
+                for acct in parsed
+                for model, reset_at in acct.rate_limits.items()
+            ]
+            heapq.heapify(heap)
+            self._expiry_heaps[provider_id] = heap
+        # Shared, read-only view: internal callers build new lists rather than
+        # mutating this one, and list_accounts hands out a copy
+        return parsed
 
-    def _save_accounts(self, provider_id: str, accounts: list[AccountEntry]) -> None:
+    def _save_accounts(
+        self,
+        provider_id: str,
+        accounts: list[AccountEntry],
+        *,
+        background: bool = False,
+    ) -> None:
         pool = self._get_pool(provider_id)
         pool["accounts"] = [self._account_to_dict(a) for a in accounts]
-        self._save()
+        if accounts is not self._parsed.get(provider_id):
+            self._parsed[provider_id] = list(accounts)
+        if background:
+            self._schedule_save()
+        else:
+            self._save()
 
     # ── public API ───────────────────────────────────────────────
 
@@ -186,7 +264,7 @@ class AccountPool:
                 email=email,
                 credentials=credentials,
                 account_id=credentials.account_id,
-                added_at=int(time.time() * 1000),
+                added_at=_now_ms(),
             )
         )
         self._save_accounts(provider_id, accounts)
@@ -201,10 +279,10 @@ class AccountPool:
         return True
 
     def list_accounts(self, provider_id: str) -> list[AccountEntry]:
-        return self._load_accounts(provider_id)
+        return list(self._load_accounts(provider_id))
 
     def account_count(self, provider_id: str) -> int:
-        return len([a for a in self._load_accounts(provider_id) if a.enabled])
+        return sum(1 for a in self._load_accounts(provider_id) if a.enabled)
 
     def get_active_credentials(self, provider_id: str) -> OAuthCredentials | None:
         """Get credentials for the current active account."""
@@ -223,8 +301,8 @@ class AccountPool:
         if not accounts:
             return None
 
-        now_ms = int(time.time() * 1000)
-        self._clear_expired_limits(accounts, now_ms)
+        now_ms = _now_ms()
+        self._clear_expired_limits(provider_id, accounts, now_ms)
 
         pool = self._get_pool(provider_id)
         strategy = pool.get("strategy", "sticky")
@@ -269,8 +347,8 @@ class AccountPool:
         if not accounts:
             return None
 
-        now_ms = int(time.time() * 1000)
-        self._clear_expired_limits(accounts, now_ms)
+        now_ms = _now_ms()
+        limits_changed = self._clear_expired_limits(provider_id, accounts, now_ms)
 
         pool = self._get_pool(provider_id)
         strategy = pool.get("strategy", "sticky")
@@ -311,10 +389,20 @@ class AccountPool:
             else:
                 chosen_idx, chosen = available[0]
 
-        # Update state
+        # Update state; only hit the disk when something meaningful changed
+        dirty = (
+            limits_changed
+            or chosen_idx != active_idx
+            or chosen.last_used is None
+            or now_ms - chosen.last_used >= LAST_USED_PERSIST_MS
+        )
         chosen.last_used = now_ms
         pool["active_index"] = chosen_idx
-        self._save_accounts(provider_id, accounts)
+        if dirty:
+            self._save_accounts(provider_id, accounts, background=True)
+        else:
+            # Keep the fresher timestamp in memory; the next save persists it
+            pool["accounts"][chosen_idx]["last_used"] = now_ms
         return chosen
 
     def mark_rate_limited(
@@ -326,12 +414,16 @@ class AccountPool:
     ) -> None:
         """Mark an account as rate-limited for a specific model."""
         accounts = self._load_accounts(provider_id)
-        now_ms = int(time.time() * 1000)
+        now_ms = _now_ms()
 
         for acct in accounts:
             if acct.email == email:
                 reset_at = now_ms + int(reset_seconds * 1000)
                 acct.rate_limits[model] = reset_at
+                heapq.heappush(
+                    self._expiry_heaps.setdefault(provider_id, []),
+                    (reset_at, email, model),
+                )
 
                 # Escalating backoff for consecutive 429s
                 if (
@@ -356,7 +448,7 @@ class AccountPool:
                 )
                 break
 
-        self._save_accounts(provider_id, accounts)
+        self._save_accounts(provider_id, accounts, background=True)
 
     def rotate(
         self, provider_id: str, model: str | None = None
@@ -368,8 +460,8 @@ class AccountPool:
             return None
 
         current = pool.get("active_index", 0)
-        now_ms = int(time.time() * 1000)
-        self._clear_expired_limits(accounts, now_ms)
+        now_ms = _now_ms()
+        self._clear_expired_limits(provider_id, accounts, now_ms)
 
         # Find next available account that's different from current
         for offset in range(1, len(accounts)):
@@ -383,7 +475,7 @@ class AccountPool:
                 continue
             pool["active_index"] = idx
             acct.last_used = now_ms
-            self._save_accounts(provider_id, accounts)
+            self._save_accounts(provider_id, accounts, background=True)
             logger.info("Rotated to account %s for %s", acct.email, provider_id)
             return acct
 
@@ -405,22 +497,34 @@ class AccountPool:
 
     # ── private ──────────────────────────────────────────────────
 
-    @staticmethod
     def _clear_expired_limits(
-        accounts: list[AccountEntry], now_ms: int
-    ) -> None:
+        self, provider_id: str, accounts: list[AccountEntry], now_ms: int
+    ) -> bool:
+        """Drop expired rate limits and cooldowns; return True if anything changed."""
+        changed = False
+        heap = self._expiry_heaps.get(provider_id)
+        if heap and heap[0][0] <= now_ms:
+            by_email = {acct.email: acct for acct in accounts}
+            while heap and heap[0][0] <= now_ms:
+                reset_at, email, model = heapq.heappop(heap)
+                acct = by_email.get(email)
+                # Skip stale entries superseded by a later limit or a removed account
+                if acct is not None and acct.rate_limits.get(model) == reset_at:
+                    del acct.rate_limits[model]
+                    changed = True
         for acct in accounts:
-            expired = [m for m, t in acct.rate_limits.items() if t <= now_ms]
-            for m in expired:
-                del acct.rate_limits[m]
             if acct.cooling_until and acct.cooling_until <= now_ms:
                 acct.cooling_until = None
+                changed = True
             # Reset consecutive counter if no recent 429s
             if (
-                acct.last_429_at
+                acct.consecutive_429s
+                and acct.last_429_at
                 and (now_ms - acct.last_429_at) > BACKOFF_RESET_S * 1000
             ):
                 acct.consecutive_429s = 0
+                changed = True
+        return changed
 
 
 # ── singleton ────────────────────────────────────────────────────
@@ -7,20 +7,29 @@ Uses the official Gemini CLI OAuth client for authentication.
 """
 
 import asyncio
+import base64
+import functools
 import hashlib
 import html as html_mod
-import json
 import logging
 import secrets
 import socket
-import threading
 import time
-from http.server import BaseHTTPRequestHandler, HTTPServer
+from collections import OrderedDict
+from collections.abc import Mapping
+from dataclasses import dataclass, field
+from http import HTTPStatus
+from types import MappingProxyType
 from typing import Any
 from urllib.parse import parse_qs, urlencode, urlparse
 
 import httpx
 
+from esprit.providers.antigravity_format import (
+    _CLIENT_METADATA,
+    _GOOG_API_CLIENT,
+    _USER_AGENT,
+)
 from esprit.providers.base import (
     AuthCallbackResult,
     AuthMethod,
@@ -28,6 +37,8 @@ from esprit.providers.base import (
     OAuthCredentials,
     ProviderAuth,
 )
+from esprit.utils import fast_json
+from esprit.utils.loop_clients import LoopClients
 
 logger = logging.getLogger(__name__)
 
@@ -48,6 +59,16 @@ SCOPES = [
     "https://www.googleapis.com/auth/experimentsandconfigs",
 ]
 
+# Authorization URL parameters shared by every login
+_STATIC_AUTH_PARAMS: Mapping[str, str] = MappingProxyType({
+    "response_type": "code",
+    "client_id": CLIENT_ID,
+    "scope": " ".join(SCOPES),
+    "code_challenge_method": "S256",
+    "access_type": "offline",
+    "prompt": "consent",
+})
+
 # Cloud Code endpoints (in fallback order: sandbox daily → sandbox autopush → prod)
 ENDPOINTS = [
     "https://daily-cloudcode-pa.sandbox.googleapis.com",
@@ -63,9 +84,38 @@ LOAD_ENDPOINTS = [
 ]
 
 CALLBACK_TIMEOUT = 300  # 5 minutes
+_MAX_PENDING_AUTH = 4  # concurrent logins kept waiting for a callback
+_MAX_HEADER_LINES = 100  # per callback request, read within one 10 s deadline
+
+# Headers that never change within a process, built once instead of per request
+_STATIC_HEADERS: Mapping[str, str] = MappingProxyType({
+    "Content-Type": "application/json",
+    "User-Agent": _USER_AGENT,
+    "X-Goog-Api-Client": _GOOG_API_CLIENT,
+    "Client-Metadata": _CLIENT_METADATA,
+})
+
+
+def _new_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        timeout=httpx.Timeout(30.0),
+        limits=httpx.Limits(max_keepalive_connections=20, keepalive_expiry=300),
+    )
+
+
+_clients = LoopClients(_new_client)
+
+
+def _get_client() -> httpx.AsyncClient:
+    """Shared client so token, userinfo and loadCodeAssist calls reuse TLS connections.
+
+    One client per event loop, closed when that loop's ``asyncio.run`` session ends.
+    """
+    return _clients.get()
+
 
 # Available models
-ANTIGRAVITY_MODELS = {
+ANTIGRAVITY_MODELS: frozenset[str] = frozenset({
     "claude-opus-4-6-thinking",
     "claude-opus-4-5-thinking",
     "claude-sonnet-4-5-thinking",
@@ -78,7 +128,7 @@ ANTIGRAVITY_MODELS = {
     "gemini-3-pro-high",
     "gemini-3-pro-image",
     "gemini-3-pro-low",
-}
+})
 
 # Fallback chain: ordered by capability (high → low).
 # When a model fails persistently, try the next one down.
@@ -97,19 +147,22 @@ ANTIGRAVITY_FALLBACK_CHAIN: list[str] = [
 ]
 
 
-def get_fallback_models(current_model: str) -> list[str]:
-    """Get ordered list of fallback models to try after the current one fails."""
+_FALLBACK_INDEX: dict[str, int] = {m: i for i, m in enumerate(ANTIGRAVITY_FALLBACK_CHAIN)}
+# Models outside the chain fall back to everything from gemini-3-flash down
+_DEFAULT_FALLBACK_START = _FALLBACK_INDEX.get("gemini-3-flash", len(ANTIGRAVITY_FALLBACK_CHAIN))
+
+
+@functools.lru_cache(maxsize=32)
+def get_fallback_models(current_model: str) -> tuple[str, ...]:
+    """Get ordered fallback models to try after the current one fails.
+
+    Returned as a tuple because the result is cached and shared between callers.
+    """
     bare = current_model.split("/", 1)[-1] if "/" in current_model else current_model
-    try:
-        idx = ANTIGRAVITY_FALLBACK_CHAIN.index(bare)
-        return ANTIGRAVITY_FALLBACK_CHAIN[idx + 1:]
-    except ValueError:
-        # Model not in chain — return everything below gemini-3-flash
-        try:
-            idx = ANTIGRAVITY_FALLBACK_CHAIN.index("gemini-3-flash")
-            return ANTIGRAVITY_FALLBACK_CHAIN[idx:]
-        except ValueError:
-            return []
+    idx = _FALLBACK_INDEX.get(bare)
+    start = _DEFAULT_FALLBACK_START if idx is None else idx + 1
+    return tuple(ANTIGRAVITY_FALLBACK_CHAIN[start:])
+
 
 HTML_SUCCESS = """<!doctype html>
 <html>
@@ -135,85 +188,188 @@ HTML_SUCCESS = """<!doctype html>
     <script>setTimeout(() => window.close(), 2000)</script>
   </body>
 </html>"""
+_HTML_SUCCESS_BYTES = HTML_SUCCESS.encode()
 
 
 def _generate_pkce() -> tuple[str, str]:
     """Generate PKCE code verifier and challenge (S256)."""
     verifier = secrets.token_urlsafe(32)
     digest = hashlib.sha256(verifier.encode()).digest()
-    import base64
-
-    challenge = base64.urlsafe_b64encode(digest).rstrip(b"=").decode()
+    # A 32-byte digest always encodes to 43 characters plus one "=" of padding
+    challenge = base64.urlsafe_b64encode(digest)[:-1].decode("ascii")
     return verifier, challenge
 
 
 def _generate_state() -> str:
-    import base64
+    return secrets.token_urlsafe(32)
 
-    return base64.urlsafe_b64encode(secrets.token_bytes(32)).rstrip(b"=").decode()
 
+def _bind_callback_socket() -> socket.socket:
+    """Bind and listen on a free loopback port for the OAuth callback.
 
-def _find_free_port() -> int:
-    """Find an available port for the OAuth callback server."""
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-        s.bind(("127.0.0.1", 0))
-        return s.getsockname()[1]
+    The socket stays open until the callback server adopts it, so no other
+    process can take the port in between, and an early browser redirect
+    simply waits in the listen backlog.
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        sock.bind(("127.0.0.1", 0))
+        sock.listen(8)
+        sock.setblocking(False)  # noqa: FBT003
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+
+async def _wait_for_callback(
+    sock: socket.socket, expected_state: str
+) -> tuple[str | None, str | None]:
+    """Serve ``/oauth2callback`` on ``sock`` until the redirect arrives.
+
+    Returns ``(code, error)``; both are None if nothing arrived within
+    ``CALLBACK_TIMEOUT``.
+    """
+    result: asyncio.Future[tuple[str | None, str | None]] = (
+        asyncio.get_running_loop().create_future()
+    )
+
+    async def read_request_line(reader: asyncio.StreamReader) -> bytes:
+        request_line = await reader.readline()
+        # Only the request line matters; skip a bounded number of headers
+        for _ in range(_MAX_HEADER_LINES):
+            if await reader.readline() in (b"\r\n", b"\n", b""):
+                return request_line
+        raise ValueError("too many header lines")
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request_line = await asyncio.wait_for(read_request_line(reader), 10)
+            parts = request_line.decode("latin-1").split()
+            parsed = urlparse(parts[1] if len(parts) >= 2 and parts[0] == "GET" else "")
+            if parsed.path != "/oauth2callback":
+                _write_html(writer, 404, "<h1>Not found</h1>")
+                return
+            params = parse_qs(parsed.query)
+            error = params.get("error", [None])[0]
+            if error:
+                message = params.get("error_description", [error])[0]
+                _write_html(writer, 400, f"<h1>Error: {html_mod.escape(str(message))}</h1>")
+                outcome: tuple[str | None, str | None] = (None, message)
+            else:
+                code = params.get("code", [None])[0]
+                state = params.get("state", [None])[0]
+                if not code or state != expected_state:
+                    _write_html(writer, 400, "<h1>Invalid callback</h1>")
+                    outcome = (None, "Invalid callback")
+                else:
+                    _write_html(writer, 200, _HTML_SUCCESS_BYTES)
+                    outcome = (code, None)
+            if not result.done():
+                result.set_result(outcome)
+        except (TimeoutError, OSError, ValueError):
+            # ValueError covers lines over the StreamReader limit and undecodable input
+            pass
+        finally:
+            writer.close()
 
+    try:
+        server = await asyncio.start_server(handle, sock=sock)
+    except OSError:
+        sock.close()
+        raise
+    try:
+        return await asyncio.wait_for(result, CALLBACK_TIMEOUT)
+    except TimeoutError:
+        return None, None
+    finally:
+        server.close()
+        await server.wait_closed()
 
-class _CallbackHandler(BaseHTTPRequestHandler):
-    server: "_CallbackServer"
 
-    def log_message(self, format: str, *args: Any) -> None:
-        pass
+def _write_html(writer: asyncio.StreamWriter, status: int, html: str | bytes) -> None:
+    body = html if isinstance(html, bytes) else html.encode()
+    head = (
+        f"HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\n"
+        "Content-Type: text/html; charset=utf-8\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        "Connection: close\r\n\r\n"
+    )
+    writer.write(head.encode() + body)
 
-    def do_GET(self) -> None:
-        parsed = urlparse(self.path)
-        if parsed.path == "/oauth2callback":
-            params = parse_qs(parsed.query)
-            error = params.get("error", [None])[0]
-            if error:
-                self.server.error = params.get("error_description", [error])[0]
-                self._send(400, f"<h1>Error: {html_mod.escape(str(self.server.error))}</h1>")
-                return
-            code = params.get("code", [None])[0]
-            state = params.get("state", [None])[0]
-            if not code or state != self.server.expected_state:
-                self.server.error = "Invalid callback"
-                self._send(400, "<h1>Invalid callback</h1>")
-                return
-            self.server.code = code
-            self._send(200, HTML_SUCCESS)
-        else:
-            self.send_error(404)
 
-    def _send(self, status: int, html: str) -> None:
-        self.send_response(status)
-        self.send_header("Content-Type", "text/html; charset=utf-8")
-        self.end_headers()
-        self.wfile.write(html.encode())
+def _email_from_id_token(id_token: Any) -> str | None:
+    """Read the ``email`` claim from an OpenID id_token payload (signature not checked).
+
+    The token comes straight from Google's token endpoint over TLS.
+    """
+    if not isinstance(id_token, str):
+        return None
+    parts = id_token.split(".")
+    if len(parts) != 3:
+        return None
+    try:
+        payload = parts[1]
+        claims = fast_json.loads(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))
+    except (ValueError, TypeError):
+        return None
+    email = claims.get("email") if isinstance(claims, dict) else None
+    return email if isinstance(email, str) and email else None
+
 
+async def _fetch_email(access_token: str) -> str:
+    """Look up the account email, or ``"unknown"`` if userinfo is unavailable."""
+    try:
+        info = await _get_client().get(
+            USERINFO_URL,
+            headers={"Authorization": f"Bearer {access_token}"},
+            timeout=10,
+        )
+        if info.is_success:
+            return fast_json.loads(info.content).get("email", "unknown")
+    except Exception:
+        pass
+    return "unknown"
 
-class _CallbackServer(HTTPServer):
-    def __init__(self, port: int, expected_state: str):
-        super().__init__(("127.0.0.1", port), _CallbackHandler)
-        self.expected_state = expected_state
-        self.code: str | None = None
-        self.error: str | None = None
+
+# Discovered projects keyed by a digest of the access token (never the raw token), so
+# requests on credentials saved without a project ID don't re-query loadCodeAssist.
+_PROJECT_CACHE_TTL_S = 3600
+_PROJECT_CACHE_SIZE = 256
+_project_cache: OrderedDict[str, tuple[float, tuple[str, str | None]]] = OrderedDict()
 
 
 async def _discover_project(access_token: str) -> tuple[str | None, str | None]:
     """Discover Cloud Code project ID via loadCodeAssist.
 
-    Returns (project_id, managed_project_id).
+    Returns (project_id, managed_project_id). Successful lookups are cached
+    per access token for ``_PROJECT_CACHE_TTL_S``.
     """
+    key = hashlib.sha256(access_token.encode()).hexdigest()[:16]
+    cached = _project_cache.get(key)
+    if cached is not None:
+        stored_at, result = cached
+        if time.monotonic() - stored_at < _PROJECT_CACHE_TTL_S:
+            _project_cache.move_to_end(key)
+            return result
+        del _project_cache[key]
+
+    project, managed = await _query_project(access_token)
+    if project:
+        _project_cache[key] = (time.monotonic(), (project, managed))
+        if len(_project_cache) > _PROJECT_CACHE_SIZE:
+            _project_cache.popitem(last=False)
+    return project, managed
+
+
+async def _query_project(access_token: str) -> tuple[str | None, str | None]:
+    """Ask the loadCodeAssist endpoints for the project behind ``access_token``."""
     headers = {
         "Authorization": f"Bearer {access_token}",
         "Content-Type": "application/json",
         "User-Agent": "google-api-nodejs-client/9.15.1",
-        "X-Goog-Api-Client": "google-cloud-sdk vscode_cloudshelleditor/0.1",
-        "Client-Metadata": json.dumps(
-            {"ideType": "IDE_UNSPECIFIED", "platform": "PLATFORM_UNSPECIFIED", "pluginType": "GEMINI"}
-        ),
+        "X-Goog-Api-Client": _GOOG_API_CLIENT,
+        "Client-Metadata": _CLIENT_METADATA,
     }
     body = {
         "metadata": {
@@ -223,32 +379,93 @@ async def _discover_project(access_token: str) -> tuple[str | None, str | None]:
         }
     }
 
-    for endpoint in LOAD_ENDPOINTS:
-        try:
-            async with httpx.AsyncClient(timeout=15) as client:
-                resp = await client.post(
-                    f"{endpoint}/v1internal:loadCodeAssist",
-                    headers=headers,
-                    json=body,
-                )
-                if resp.is_success:
-                    data = resp.json()
-                    # cloudaicompanionProject can be a string or an object with .id
-                    raw_project = data.get("cloudaicompanionProject")
-                    if isinstance(raw_project, dict):
-                        project = raw_project.get("id")
-                    elif isinstance(raw_project, str):
-                        project = raw_project
-                    else:
-                        project = data.get("projectId")
-                    managed = data.get("managedProjectId")
-                    if project:
-                        return project, managed
-        except Exception:
-            continue
+    # Ask every healthy endpoint at once; a slow or hung one no longer delays the rest.
+    # If all of them are backing off, try them all anyway rather than giving up.
+    now = time.monotonic()
+    endpoints = [
+        endpoint
+        for endpoint in LOAD_ENDPOINTS
+        if _endpoint_backoff.get(endpoint, (0, 0.0))[1] <= now
+    ] or LOAD_ENDPOINTS
+    tasks = [
+        asyncio.create_task(_load_code_assist(endpoint, headers, body))
+        for endpoint in endpoints
+    ]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            project, managed = await next_done
+            if project:
+                return project, managed
+    finally:
+        for task in tasks:
+            task.cancel()
+    return None, None
+
+
+# loadCodeAssist endpoints that recently failed: endpoint -> (consecutive failures, retry_at)
+_endpoint_backoff: dict[str, tuple[int, float]] = {}
+_ENDPOINT_BACKOFF_BASE_S = 60
+_ENDPOINT_BACKOFF_MAX_S = 900
+# An unreachable endpoint should fail at connect time, not after a full read timeout
+_DISCOVERY_TIMEOUT = httpx.Timeout(10.0, connect=3.0, write=3.0, pool=2.0)
+
+
+def _mark_endpoint_down(endpoint: str) -> None:
+    failures = _endpoint_backoff.get(endpoint, (0, 0.0))[0] + 1
+    delay = min(_ENDPOINT_BACKOFF_BASE_S * 2 ** (failures - 1), _ENDPOINT_BACKOFF_MAX_S)
+    _endpoint_backoff[endpoint] = (failures, time.monotonic() + delay)
+
+
+async def _load_code_assist(
+    endpoint: str, headers: dict[str, str], body: dict[str, Any]
+) -> tuple[str | None, str | None]:
+    """Query one loadCodeAssist endpoint; ``(None, None)`` on any failure."""
+    try:
+        resp = await _get_client().post(
+            f"{endpoint}/v1internal:loadCodeAssist",
+            headers=headers,
+            json=body,
+            timeout=_DISCOVERY_TIMEOUT,
+        )
+    except Exception:
+        _mark_endpoint_down(endpoint)
+        return None, None
+    if resp.status_code >= 500:
+        _mark_endpoint_down(endpoint)
+        return None, None
+    _endpoint_backoff.pop(endpoint, None)
+    try:
+        if resp.is_success:
+            data = fast_json.loads(resp.content)
+            # cloudaicompanionProject can be a string or an object with .id
+            raw_project = data.get("cloudaicompanionProject")
+            if isinstance(raw_project, dict):
+                project = raw_project.get("id")
+            elif isinstance(raw_project, str):
+                project = raw_project
+            else:
+                project = data.get("projectId")
+            return project, data.get("managedProjectId")
+    except Exception:
+        pass
     return None, None
 
 
+# In-flight token refreshes keyed by a digest of the refresh token
+_refresh_tasks: dict[str, "asyncio.Future[OAuthCredentials]"] = {}
+
+
+@dataclass(slots=True)
+class _PendingAuth:
+    """PKCE and redirect details kept between ``authorize`` and ``callback``."""
+
+    verifier: str
+    state: str
+    redirect_uri: str
+    sock: socket.socket
+    created_at: float = field(default_factory=time.monotonic)
+
+
 class AntigravityProvider(ProviderAuth):
     """Antigravity provider for free Claude/Gemini access via Google Cloud Code."""
 
@@ -256,33 +473,26 @@ class AntigravityProvider(ProviderAuth):
     display_name = "Antigravity (Free Claude/Gemini)"
 
     def __init__(self) -> None:
-        self._pending_auth: dict[str, Any] = {}
+        # Keyed by PKCE verifier so overlapping login attempts don't clobber each other
+        self._pending_auth: dict[str, _PendingAuth] = {}
 
     async def authorize(self, **kwargs: Any) -> AuthorizationResult:
         verifier, challenge = _generate_pkce()
         state = _generate_state()
-        port = _find_free_port()
+        sock = _bind_callback_socket()
+        port = sock.getsockname()[1]
         redirect_uri = f"http://127.0.0.1:{port}/oauth2callback"
 
         params = {
-            "response_type": "code",
-            "client_id": CLIENT_ID,
+            **_STATIC_AUTH_PARAMS,
             "redirect_uri": redirect_uri,
-            "scope": " ".join(SCOPES),
             "code_challenge": challenge,
-            "code_challenge_method": "S256",
             "state": state,
-            "access_type": "offline",
-            "prompt": "consent",
         }
         auth_url = f"{AUTH_URL}?{urlencode(params)}"
 
-        self._pending_auth = {
-            "verifier": verifier,
-            "state": state,
-            "redirect_uri": redirect_uri,
-            "port": port,
-        }
+        self._evict_pending_auth()
+        self._pending_auth[verifier] = _PendingAuth(verifier, state, redirect_uri, sock)
 
         return AuthorizationResult(
             url=auth_url,
@@ -291,93 +501,93 @@ class AntigravityProvider(ProviderAuth):
             verifier=verifier,
         )
 
+    def _evict_pending_auth(self) -> None:
+        """Close abandoned logins so their listening sockets don't pile up."""
+        cutoff = time.monotonic() - CALLBACK_TIMEOUT
+        # Oldest first; keep room for the login about to be added
+        excess = len(self._pending_auth) - (_MAX_PENDING_AUTH - 1)
+        for key, pending in list(self._pending_auth.items()):
+            if excess <= 0 and pending.created_at >= cutoff:
+                break
+            del self._pending_auth[key]
+            pending.sock.close()
+            excess -= 1
+
     async def callback(
         self, auth_result: AuthorizationResult, code: str | None = None
     ) -> AuthCallbackResult:
-        verifier = auth_result.verifier or self._pending_auth.get("verifier")
-        state = self._pending_auth.get("state")
-        redirect_uri = self._pending_auth.get("redirect_uri")
-        port = self._pending_auth.get("port")
-
-        if not verifier or not state or not redirect_uri or not port:
+        # Without a verifier, fall back to the most recent authorize()
+        key = auth_result.verifier or next(reversed(self._pending_auth), None)
+        pending = self._pending_auth.pop(key, None) if key else None
+        if pending is None:
             return AuthCallbackResult(success=False, error="Missing PKCE/state/port")
+        verifier = pending.verifier
+        state = pending.state
+        redirect_uri = pending.redirect_uri
 
-        # Start callback server
-        server = _CallbackServer(port, state)
-        server_thread = threading.Thread(target=server.handle_request, daemon=True)
-        server_thread.start()
+        # Wait for the browser redirect on the event loop itself
         try:
-            await asyncio.to_thread(server_thread.join, CALLBACK_TIMEOUT)
-        finally:
-            try:
-                server.shutdown()
-                server.server_close()
-            except Exception:
-                pass
-
-        if server.error:
-            return AuthCallbackResult(success=False, error=server.error)
-        if not server.code:
+            auth_code, error = await _wait_for_callback(pending.sock, state)
+        except OSError as e:
+            return AuthCallbackResult(success=False, error=f"Callback server failed: {e}")
+
+        if error:
+            return AuthCallbackResult(success=False, error=error)
+        if not auth_code:
             return AuthCallbackResult(success=False, error="Authorization timed out")
 
         try:
-            async with httpx.AsyncClient() as client:
-                # Exchange code for tokens
-                resp = await client.post(
-                    TOKEN_URL,
-                    data={
-                        "grant_type": "authorization_code",
-                        "code": server.code,
-                        "redirect_uri": redirect_uri,
-                        "client_id": CLIENT_ID,
-                        "client_secret": CLIENT_SECRET,
-                        "code_verifier": verifier,
-                    },
-                    headers={"Content-Type": "application/x-www-form-urlencoded"},
-                    timeout=30,
-                )
-                if not resp.is_success:
-                    return AuthCallbackResult(
-                        success=False,
-                        error=f"Token exchange failed: {resp.status_code}",
-                    )
-
-                tokens = resp.json()
-                access_token = tokens.get("access_token")
-                refresh_token = tokens.get("refresh_token")
-                expires_at = int(time.time() * 1000) + (
-                    tokens.get("expires_in", 3600) * 1000
+            client = _get_client()
+            # Exchange code for tokens
+            resp = await client.post(
+                TOKEN_URL,
+                data={
+                    "grant_type": "authorization_code",
+                    "code": auth_code,
+                    "redirect_uri": redirect_uri,
+                    "client_id": CLIENT_ID,
+                    "client_secret": CLIENT_SECRET,
+                    "code_verifier": verifier,
+                },
+                headers={"Content-Type": "application/x-www-form-urlencoded"},
+                timeout=30,
+            )
+            if not resp.is_success:
+                return AuthCallbackResult(
+                    success=False,
+                    error=f"Token exchange failed: {resp.status_code}",
                 )
 
-                # Get user email
-                email = "unknown"
-                try:
-                    info = await client.get(
-                        USERINFO_URL,
-                        headers={"Authorization": f"Bearer {access_token}"},
-                        timeout=10,
-                    )
-                    if info.is_success:
-                        email = info.json().get("email", "unknown")
-                except Exception:
-                    pass
-
-                # Discover project ID
-                project_id, managed_project_id = await _discover_project(access_token)
+            tokens = fast_json.loads(resp.content)
+            access_token = tokens.get("access_token")
+            refresh_token = tokens.get("refresh_token")
+            expires_at = int(time.time() * 1000) + (
+                tokens.get("expires_in", 3600) * 1000
+            )
 
-                credentials = OAuthCredentials(
-                    type="oauth",
-                    access_token=access_token,
-                    refresh_token=refresh_token,
-                    expires_at=expires_at,
-                    extra={
-                        "email": email,
-                        "project_id": project_id,
-                        "managed_project_id": managed_project_id,
-                    },
+            # The id_token usually carries the email; otherwise ask userinfo alongside
+            # project discovery, since both only need the access token
+            email = _email_from_id_token(tokens.get("id_token"))
+            if email:
+                project_id, managed_project_id = await _discover_project(access_token)
+            else:
+                email, (project_id, managed_project_id) = await asyncio.gather(
+                    _fetch_email(access_token), _discover_project(access_token)
                 )
 
-                return AuthCallbackResult(success=True, credentials=credentials)
+            credentials = OAuthCredentials(
+                type="oauth",
+                access_token=access_token,
+                refresh_token=refresh_token,
+                expires_at=expires_at,
+                extra={
+                    "email": email,
+                    "project_id": project_id,
+                    "managed_project_id": managed_project_id,
+                },
+            )
+
+            return AuthCallbackResult(success=True, credentials=credentials)
 
         except Exception as e:
             return AuthCallbackResult(
@@ -388,30 +598,46 @@ class AntigravityProvider(ProviderAuth):
         if not credentials.refresh_token:
             raise ValueError("No refresh token available")
 
-        async with httpx.AsyncClient() as client:
-            resp = await client.post(
-                TOKEN_URL,
-                data={
-                    "grant_type": "refresh_token",
-                    "refresh_token": credentials.refresh_token,
-                    "client_id": CLIENT_ID,
-                    "client_secret": CLIENT_SECRET,
-                },
-                headers={"Content-Type": "application/x-www-form-urlencoded"},
-                timeout=30,
-            )
-            if not resp.is_success:
-                raise ValueError(f"Token refresh failed: {resp.status_code}")
-
-            tokens = resp.json()
-            return OAuthCredentials(
-                type="oauth",
-                access_token=tokens.get("access_token"),
-                refresh_token=tokens.get("refresh_token", credentials.refresh_token),
-                expires_at=int(time.time() * 1000)
-                + (tokens.get("expires_in", 3600) * 1000),
-                extra=credentials.extra,
+        # Callers that cross the expiry buffer together (e.g. parallel agents)
+        # share one token request instead of each refreshing separately.
+        key = hashlib.sha256(credentials.refresh_token.encode()).hexdigest()[:16]
+        task = _refresh_tasks.get(key)
+        if task is None or task.done() or task.get_loop() is not asyncio.get_running_loop():
+            task = asyncio.ensure_future(self._request_refresh(credentials))
+            _refresh_tasks[key] = task
+            task.add_done_callback(
+                lambda done: _refresh_tasks.pop(key, None)
+                if _refresh_tasks.get(key) is done
+                else None
             )
+        # Shielded so one caller being cancelled doesn't abort the refresh for the rest
+        return await asyncio.shield(task)
+
+    async def _request_refresh(self, credentials: OAuthCredentials) -> OAuthCredentials:
+        client = _get_client()
+        resp = await client.post(
+            TOKEN_URL,
+            data={
+                "grant_type": "refresh_token",
+                "refresh_token": credentials.refresh_token,
+                "client_id": CLIENT_ID,
+                "client_secret": CLIENT_SECRET,
+            },
+            headers={"Content-Type": "application/x-www-form-urlencoded"},
+            timeout=30,
+        )
+        if not resp.is_success:
+            raise ValueError(f"Token refresh failed: {resp.status_code}")
+
+        tokens = fast_json.loads(resp.content)
+        return OAuthCredentials(
+            type="oauth",
+            access_token=tokens.get("access_token"),
+            refresh_token=tokens.get("refresh_token", credentials.refresh_token),
+            expires_at=int(time.time() * 1000)
+            + (tokens.get("expires_in", 3600) * 1000),
+            extra=credentials.extra,
+        )
 
     def modify_request(
         self,
@@ -420,20 +646,8 @@ class AntigravityProvider(ProviderAuth):
         body: Any,
         credentials: OAuthCredentials,
     ) -> tuple[str, dict[str, str], Any]:
-        import platform as plat
-
-        modified = dict(headers)
+        modified = headers | _STATIC_HEADERS
         modified["Authorization"] = f"Bearer {credentials.access_token}"
-        modified["Content-Type"] = "application/json"
-        system = plat.system().lower()
-        arch = plat.machine()
-        modified["User-Agent"] = f"antigravity/1.15.8 {system}/{arch}"
-        modified["X-Goog-Api-Client"] = (
-            "google-cloud-sdk vscode_cloudshelleditor/0.1"
-        )
-        modified["Client-Metadata"] = json.dumps(
-            {"ideType": "IDE_UNSPECIFIED", "platform": "PLATFORM_UNSPECIFIED", "pluginType": "GEMINI"}
-        )
         return url, modified, body
 
     def get_auth_methods(self) -> list[dict[str, str]]:
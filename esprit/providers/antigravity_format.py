@@ -8,13 +8,17 @@ Handles:
 - Cloud Code request envelope wrapping
 """
 
+import functools
 import hashlib
 import json
 import logging
 import platform
 import uuid
+from collections.abc import AsyncIterator
 from typing import Any
 
+from esprit.utils import fast_json
+
 logger = logging.getLogger(__name__)
 
 # Type mapping for JSON Schema → Google GenAI format
@@ -50,14 +54,54 @@ _UNSUPPORTED_KEYWORDS = {
     "oneOf",
 }
 
+# Per-process header values, computed once rather than per request. The OAuth
+# client in antigravity.py sends the same ones. Client-Metadata keeps json.dumps'
+# default separators so the bytes on the wire don't change.
+_USER_AGENT = f"antigravity/1.15.8 {platform.system().lower()}/{platform.machine()}"
+_GOOG_API_CLIENT = "google-cloud-sdk vscode_cloudshelleditor/0.1"
+_CLIENT_METADATA = json.dumps(
+    {"ideType": "IDE_UNSPECIFIED", "platform": "PLATFORM_UNSPECIFIED", "pluginType": "GEMINI"}
+)
+
+
+@functools.lru_cache(maxsize=64)
+def _model_flags(model: str) -> tuple[bool, bool]:
+    """Return ``(is_claude, is_thinking)`` for a model name."""
+    return "claude" in model, "thinking" in model
+
 
 # ── Schema Sanitization ─────────────────────────────────────────
 
 
-def _sanitize_schema(schema: Any) -> dict[str, Any] | None:
-    """Convert JSON Schema to Google GenAI-compatible format."""
-    if not isinstance(schema, dict):
-        return None
+def _first_variant(variants: list[Any]) -> dict[str, Any] | None:
+    """Return the first non-null schema in an anyOf/oneOf list."""
+    for v in variants:
+        if isinstance(v, dict) and v.get("type") != "null":
+            return v
+    return None
+
+
+def _schema_children(schema: dict[str, Any]) -> list[Any]:
+    """Return the subschemas that ``_sanitize_node`` reads from ``schema``."""
+    children: list[Any] = []
+    for key in ("anyOf", "oneOf"):
+        variants = schema.get(key)
+        if variants and isinstance(variants, list):
+            children.append(_first_variant(variants))
+    if props := schema.get("properties"):
+        children.extend(props.values())
+    if items := schema.get("items"):
+        children.append(items)
+    return children
+
+
+def _sanitize_node(
+    schema: dict[str, Any], done: dict[int, dict[str, Any]]
+) -> dict[str, Any]:
+    """Sanitize one schema node whose children are already in ``done``."""
+
+    def child(node: Any) -> dict[str, Any] | None:
+        return done.get(id(node)) if isinstance(node, dict) else None
 
     result: dict[str, Any] = {}
 
@@ -75,12 +119,8 @@ def _sanitize_schema(schema: Any) -> dict[str, Any] | None:
     for key in ("anyOf", "oneOf"):
         variants = schema.get(key)
         if variants and isinstance(variants, list):
-            for v in variants:
-                if isinstance(v, dict) and v.get("type") != "null":
-                    merged = _sanitize_schema(v)
-                    if merged:
-                        result.update(merged)
-                    break
+            if merged := child(_first_variant(variants)):
+                result.update(merged)
             if "type" not in result:
                 result["type"] = "STRING"
 
@@ -96,7 +136,7 @@ def _sanitize_schema(schema: Any) -> dict[str, Any] | None:
     if props := schema.get("properties"):
         sanitized_props = {}
         for name, prop_schema in props.items():
-            sanitized = _sanitize_schema(prop_schema)
+            sanitized = child(prop_schema)
             if sanitized:
                 sanitized_props[name] = sanitized
         if sanitized_props:
@@ -115,7 +155,7 @@ def _sanitize_schema(schema: Any) -> dict[str, Any] | None:
 
     # Items (for arrays)
     if items := schema.get("items"):
-        sanitized = _sanitize_schema(items)
+        sanitized = child(items)
         if sanitized:
             result["items"] = sanitized
 
@@ -129,6 +169,34 @@ def _sanitize_schema(schema: Any) -> dict[str, Any] | None:
     return result
 
 
+def _sanitize_schema(schema: Any) -> dict[str, Any] | None:
+    """Convert JSON Schema to Google GenAI-compatible format.
+
+    Walks the schema with an explicit stack, children before parents, so deep
+    tool schemas don't cost a Python frame per node. A subschema shared by
+    several parents is sanitized once; a self-referencing one is dropped where
+    it recurses instead of overflowing the stack.
+    """
+    if not isinstance(schema, dict):
+        return None
+
+    done: dict[int, dict[str, Any]] = {}
+    seen: set[int] = set()
+    stack: list[tuple[dict[str, Any], bool]] = [(schema, False)]
+    while stack:
+        node, expanded = stack.pop()
+        if expanded:
+            done[id(node)] = _sanitize_node(node, done)
+            continue
+        if id(node) in seen:
+            continue
+        seen.add(id(node))
+        stack.append((node, True))
+        stack.extend((c, False) for c in _schema_children(node) if isinstance(c, dict))
+
+    return done[id(schema)]
+
+
 # ── Message Conversion ───────────────────────────────────────────
 
 
@@ -153,14 +221,31 @@ def _convert_content_part(part: dict[str, Any]) -> dict[str, Any]:
     return {"text": str(part.get("text", part.get("content", "")))}
 
 
+def _convert_content_parts(content: list[Any]) -> list[dict[str, Any]]:
+    """Convert a list of OpenAI content parts, inlining the common text case."""
+    return [
+        (
+            {"text": part.get("text", "")}
+            if part.get("type", "text") == "text"
+            else _convert_content_part(part)
+        )
+        if isinstance(part, dict)
+        else {"text": str(part)}
+        for part in content
+    ]
+
+
 def _convert_tool_call(tool_call: dict[str, Any]) -> dict[str, Any]:
     """Convert OpenAI tool_call to Google functionCall."""
     func = tool_call.get("function", {})
     args = func.get("arguments", "{}")
-    if isinstance(args, str):
+    if args is None or args in ("", "{}"):
+        # No-argument calls are common enough to skip the parser for
+        args = {}
+    elif isinstance(args, str):
         try:
-            args = json.loads(args)
-        except json.JSONDecodeError:
+            args = fast_json.loads(args)
+        except fast_json.JSONDecodeError:
             args = {"raw": args}
     return {
         "functionCall": {
@@ -171,32 +256,44 @@ def _convert_tool_call(tool_call: dict[str, Any]) -> dict[str, Any]:
     }
 
 
+def _first_user_text(msg: dict[str, Any]) -> str:
+    """Text of a user message as the session ID sees it: the first part for lists."""
+    content = msg.get("content", "")
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list) and content:
+        return str(content[0].get("text", ""))
+    return ""
+
+
 def _convert_messages(messages: list[dict[str, Any]]) -> tuple[
     dict[str, Any] | None,  # systemInstruction
     list[dict[str, Any]],  # contents
+    str,  # first user message text
 ]:
     """Convert OpenAI-style messages to Google GenAI format.
 
-    Returns (systemInstruction, contents).
+    Returns (systemInstruction, contents, first_user_text). The first user
+    message's text is picked up in the same pass for the session ID.
     """
     system_parts: list[dict[str, Any]] = []
     contents: list[dict[str, Any]] = []
     # Map tool_call_id → function_name for resolving functionResponse names
     tc_id_to_name: dict[str, str] = {}
+    first_user_text: str | None = None
 
     for msg in messages:
         role = msg.get("role", "user")
         content = msg.get("content", "")
 
+        if first_user_text is None and msg.get("role") == "user":
+            first_user_text = _first_user_text(msg)
+
         if role == "system":
             if isinstance(content, str):
                 system_parts.append({"text": content})
             elif isinstance(content, list):
-                for part in content:
-                    if isinstance(part, dict):
-                        system_parts.append(_convert_content_part(part))
-                    else:
-                        system_parts.append({"text": str(part)})
+                system_parts += _convert_content_parts(content)
             continue
 
         if role == "tool":
@@ -205,10 +302,12 @@ def _convert_messages(messages: list[dict[str, Any]]) -> tuple[
             # Resolve the function name from a prior assistant message's tool_calls
             func_name = tc_id_to_name.get(tool_call_id, tool_call_id)
             result_content = content
-            if isinstance(result_content, str):
+            if result_content == "{}":
+                result_content = {}
+            elif isinstance(result_content, str):
                 try:
-                    result_content = json.loads(result_content)
-                except json.JSONDecodeError:
+                    result_content = fast_json.loads(result_content)
+                except fast_json.JSONDecodeError:
                     result_content = {"result": result_content}
 
             contents.append({
@@ -227,16 +326,13 @@ def _convert_messages(messages: list[dict[str, Any]]) -> tuple[
 
         # user or assistant
         google_role = "model" if role == "assistant" else "user"
-        parts: list[dict[str, Any]] = []
-
-        if isinstance(content, str) and content:
-            parts.append({"text": content})
-        elif isinstance(content, list):
-            for part in content:
-                if isinstance(part, dict):
-                    parts.append(_convert_content_part(part))
-                else:
-                    parts.append({"text": str(part)})
+        parts: list[dict[str, Any]]
+        if isinstance(content, list):
+            parts = _convert_content_parts(content)
+        elif isinstance(content, str) and content:
+            parts = [{"text": content}]
+        else:
+            parts = []
 
         # Handle tool calls in assistant messages
         tool_calls = msg.get("tool_calls", [])
@@ -255,14 +351,33 @@ def _convert_messages(messages: list[dict[str, Any]]) -> tuple[
     if system_parts:
         system_instruction = {"role": "user", "parts": system_parts}
 
-    return system_instruction, contents
+    return system_instruction, contents, first_user_text or ""
 
 
 def _convert_tools(tools: list[dict[str, Any]] | None) -> list[dict[str, Any]] | None:
-    """Convert OpenAI-style tool definitions to Google format."""
+    """Convert OpenAI-style tool definitions to Google format.
+
+    The tool set rarely changes within a session, so conversions are cached on
+    the serialized definitions. The cache holds the converted result as JSON
+    bytes and each call parses a fresh copy, so callers may modify it.
+    """
     if not tools:
         return None
+    try:
+        key = fast_json.dumps_bytes(tools)
+    except (TypeError, ValueError):
+        return _build_tool_declarations(tools)
+    converted = _convert_tools_cached(key)
+    return fast_json.loads(converted) if converted is not None else None
+
 
+@functools.lru_cache(maxsize=32)
+def _convert_tools_cached(tools_json: bytes) -> bytes | None:
+    declarations = _build_tool_declarations(fast_json.loads(tools_json))
+    return fast_json.dumps_bytes(declarations) if declarations is not None else None
+
+
+def _build_tool_declarations(tools: list[dict[str, Any]]) -> list[dict[str, Any]] | None:
     declarations = []
     for tool in tools:
         if tool.get("type") != "function":
@@ -287,6 +402,12 @@ def _convert_tools(tools: list[dict[str, Any]] | None) -> list[dict[str, Any]] |
 # ── Request Building ─────────────────────────────────────────────
 
 
+@functools.lru_cache(maxsize=256)
+def _session_id(first_user_text: str) -> str:
+    """Derive the prompt-cache session ID, cached since every turn re-sends it."""
+    return hashlib.sha256(first_user_text.encode("utf-8")).hexdigest()[:32]
+
+
 def build_cloudcode_request(
     messages: list[dict[str, Any]],
     model: str,
@@ -311,7 +432,7 @@ def build_cloudcode_request(
     Returns:
         Complete request body for Cloud Code API
     """
-    system_instruction, contents = _convert_messages(messages)
+    system_instruction, contents, first_user_text = _convert_messages(messages)
 
     # Generation config
     gen_config: dict[str, Any] = {}
@@ -323,8 +444,7 @@ def build_cloudcode_request(
         gen_config["topP"] = top_p
 
     # Thinking config for thinking models
-    is_thinking = "thinking" in model
-    is_claude = "claude" in model
+    is_claude, is_thinking = _model_flags(model)
     if is_thinking:
         thinking_budget = 32768
         if is_claude:
@@ -357,25 +477,14 @@ def build_cloudcode_request(
     if google_tools:
         request["tools"] = google_tools
         # Claude needs VALIDATED mode for strict param checking
-        if "claude" in model:
+        if is_claude:
             request["toolConfig"] = {
                 "functionCallingConfig": {"mode": "VALIDATED"}
             }
 
     # Session ID for prompt cache continuity
-    first_user_text = ""
-    for msg in messages:
-        if msg.get("role") == "user":
-            c = msg.get("content", "")
-            if isinstance(c, str):
-                first_user_text = c
-            elif isinstance(c, list) and c:
-                first_user_text = str(c[0].get("text", ""))
-            break
     if first_user_text:
-        request["sessionId"] = hashlib.sha256(
-            first_user_text.encode()
-        ).hexdigest()[:32]
+        request["sessionId"] = _session_id(first_user_text)
 
     return {
         "project": project_id,
@@ -392,21 +501,17 @@ def build_request_headers(
     model: str,
 ) -> dict[str, str]:
     """Build HTTP headers for a Cloud Code API request."""
-    system = platform.system().lower()
-    arch = platform.machine()
-
     headers: dict[str, str] = {
         "Authorization": f"Bearer {access_token}",
         "Content-Type": "application/json",
         "Accept": "text/event-stream",
-        "User-Agent": f"antigravity/1.15.8 {system}/{arch}",
-        "X-Goog-Api-Client": "google-cloud-sdk vscode_cloudshelleditor/0.1",
-        "Client-Metadata": json.dumps(
-            {"ideType": "IDE_UNSPECIFIED", "platform": "PLATFORM_UNSPECIFIED", "pluginType": "GEMINI"}
-        ),
+        "User-Agent": _USER_AGENT,
+        "X-Goog-Api-Client": _GOOG_API_CLIENT,
+        "Client-Metadata": _CLIENT_METADATA,
     }
 
-    if "claude" in model and "thinking" in model:
+    is_claude, is_thinking = _model_flags(model)
+    if is_claude and is_thinking:
         headers["anthropic-beta"] = "interleaved-thinking-2025-05-14"
 
     return headers
@@ -415,6 +520,27 @@ def build_request_headers(
 # ── Response Parsing ─────────────────────────────────────────────
 
 
+async def aiter_sse_data(byte_stream: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Yield the raw payload of each ``data:`` line in an SSE byte stream.
+
+    Works on bytes end to end so payloads can go straight to the JSON parser
+    without a per-line UTF-8 decode.
+    """
+    buf = bytearray()
+    async for raw in byte_stream:
+        buf += raw
+        start = 0
+        while (nl := buf.find(b"\n", start)) != -1:
+            line = bytes(buf[start:nl]).rstrip(b"\r")
+            start = nl + 1
+            if line.startswith(b"data: "):
+                yield line[6:]
+        del buf[:start]
+    line = bytes(buf).rstrip(b"\r")
+    if line.startswith(b"data: "):
+        yield line[6:]
+
+
 def parse_sse_chunk(chunk_data: dict[str, Any]) -> tuple[
     str,  # text content
     list[dict[str, Any]],  # thinking blocks
@@ -425,36 +551,33 @@ def parse_sse_chunk(chunk_data: dict[str, Any]) -> tuple[
 
     Returns (text, thinking_blocks, tool_calls, usage).
     """
-    text = ""
+    text_parts: list[str] = []
     thinking_blocks: list[dict[str, Any]] = []
     tool_calls: list[dict[str, Any]] = []
     usage: dict[str, int] = {}
 
     # Navigate to the response data
-    response = chunk_data
-    if "response" in chunk_data:
-        response = chunk_data["response"]
+    response = chunk_data.get("response", chunk_data)
 
-    candidates = response.get("candidates", [])
+    candidates = response.get("candidates")
     if not candidates:
         # Check for usage-only chunk
         if um := response.get("usageMetadata"):
             usage = _parse_usage(um)
-        return text, thinking_blocks, tool_calls, usage
+        return "", thinking_blocks, tool_calls, usage
 
-    candidate = candidates[0]
-    content = candidate.get("content", {})
-    parts = content.get("parts", [])
+    content = candidates[0].get("content")
+    parts = content.get("parts", ()) if content else ()
 
     for part in parts:
         if "functionCall" in part:
             fc = part["functionCall"]
             tool_calls.append({
-                "id": fc.get("id", f"call_{uuid.uuid4().hex[:8]}"),
+                "id": fc["id"] if "id" in fc else f"call_{uuid.uuid4().hex[:8]}",
                 "type": "function",
                 "function": {
                     "name": fc.get("name", ""),
-                    "arguments": json.dumps(fc.get("args", {})),
+                    "arguments": fast_json.dumps(fc.get("args", {})),
                 },
             })
         elif part.get("thought"):
@@ -463,21 +586,17 @@ def parse_sse_chunk(chunk_data: dict[str, Any]) -> tuple[
                 "thinking": part.get("text", ""),
             })
         elif "text" in part:
-            text += part["text"]
+            text_parts.append(part["text"])
 
     if um := response.get("usageMetadata"):
         usage = _parse_usage(um)
 
-    return text, thinking_blocks, tool_calls, usage
+    return "".join(text_parts), thinking_blocks, tool_calls, usage
 
 
 def parse_finish_reason(chunk_data: dict[str, Any]) -> str | None:
     """Extract finish reason from a Cloud Code response chunk."""
-    response = chunk_data
-    if "response" in chunk_data:
-        response = chunk_data["response"]
-
-    candidates = response.get("candidates", [])
+    candidates = chunk_data.get("response", chunk_data).get("candidates")
     if not candidates:
         return None
 
@@ -107,7 +107,9 @@ class GoogleGeminiProvider(ProviderAuth):
                 )
 
                 if not response.is_success:
-                    logger.error(f"Token exchange failed: {response.status_code} {response.text}")
+                    logger.error(
+                        "Token exchange failed: %s %s", response.status_code, response.text
+                    )
                     return AuthCallbackResult(
                         success=False,
                         error=f"Token exchange failed: {response.status_code}",
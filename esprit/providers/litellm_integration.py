@@ -156,7 +156,7 @@ class ProviderAuthClient:
                 self.token_store.set(provider_id, new_credentials)
             return new_credentials
         except Exception as e:
-            logger.warning(f"Token refresh failed for {provider_id}: {e}")
+            logger.warning("Token refresh failed for %s: %s", provider_id, e)
             return credentials
 
     async def make_request(
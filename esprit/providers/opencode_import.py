@@ -49,7 +49,7 @@ def load_opencode_credentials() -> dict[str, Any]:
         with auth_path.open(encoding="utf-8") as f:
             return json.load(f)
     except (json.JSONDecodeError, OSError) as e:
-        logger.warning(f"Failed to load OpenCode credentials: {e}")
+        logger.warning("Failed to load OpenCode credentials: %s", e)
         return {}
 
 
@@ -133,7 +133,7 @@ def import_from_opencode(provider_id: str | None = None) -> dict[str, bool]:
         if converted:
             token_store.set(esprit_provider, converted)
             results[esprit_provider] = True
-            logger.info(f"Imported {oc_provider} -> {esprit_provider}")
+            logger.info("Imported %s -> %s", oc_provider, esprit_provider)
         else:
             results[esprit_provider] = False
 
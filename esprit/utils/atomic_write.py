@@ -0,0 +1,37 @@
+"""Crash-safe file writes for state kept under ~/.esprit."""
+
+import json
+import os
+import tempfile
+from pathlib import Path
+from typing import Any
+
+
+def atomic_write_json(
+    path: Path,
+    data: Any,
+    *,
+    indent: int | None = None,
+    private: bool = True,
+) -> None:
+    """Write ``data`` as JSON to ``path`` via a temp file and ``os.replace``.
+
+    Readers see either the old or the new file, never a truncated one. Output is
+    compact unless ``indent`` is given. With ``private`` the file is made
+    owner-only (skipped on Windows). Errors are raised after the temp file is
+    cleaned up.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=str(path.parent), suffix=".tmp", prefix=f"{path.stem}_")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=indent, separators=None if indent else (",", ":"))
+        if private and os.name != "nt":
+            os.chmod(tmp_path, 0o600)
+        os.replace(tmp_path, str(path))
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
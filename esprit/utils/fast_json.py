@@ -0,0 +1,39 @@
+"""JSON encode/decode helpers that use orjson when available.
+
+orjson is installed alongside ``litellm[proxy]``; the stdlib ``json`` module is
+used as a fallback so nothing breaks when it is missing. ``orjson.JSONDecodeError``
+subclasses ``json.JSONDecodeError``, so callers can keep catching the latter.
+"""
+
+import json
+from typing import Any
+
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson ships with litellm[proxy]
+    orjson = None  # type: ignore[assignment]
+
+
+JSONDecodeError = json.JSONDecodeError
+
+
+def loads(data: str | bytes | bytearray | memoryview) -> Any:
+    """Parse JSON from text or UTF-8 bytes."""
+    if orjson is not None:
+        return orjson.loads(data)
+    if isinstance(data, memoryview):
+        data = data.tobytes()
+    return json.loads(data)
+
+
+def dumps_bytes(obj: Any) -> bytes:
+    """Serialize ``obj`` to compact UTF-8 JSON bytes."""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def dumps(obj: Any) -> str:
+    """Serialize ``obj`` to a compact JSON string."""
+    return dumps_bytes(obj).decode("utf-8")
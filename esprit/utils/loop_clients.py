@@ -0,0 +1,47 @@
+"""Shared httpx clients scoped to the running event loop."""
+
+import asyncio
+import weakref
+from collections.abc import Callable
+
+import httpx
+
+
+class LoopClients:
+    """Hand out one pooled ``httpx.AsyncClient`` per running event loop.
+
+    httpx clients are bound to the loop they first ran on, and the CLI runs
+    several ``asyncio.run`` sessions, so each loop gets its own client. Clients
+    are keyed weakly by loop and closed when the loop shuts down: a sentinel
+    task that ``asyncio.run`` cancels on exit awaits ``aclose()`` while the loop
+    can still run it.
+    """
+
+    def __init__(self, factory: Callable[[], httpx.AsyncClient]) -> None:
+        self._factory = factory
+        self._clients: weakref.WeakKeyDictionary[
+            asyncio.AbstractEventLoop, httpx.AsyncClient
+        ] = weakref.WeakKeyDictionary()
+        # Strong references so pending closer tasks aren't garbage collected
+        self._closers: set[asyncio.Task[None]] = set()
+
+    def get(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None or client.is_closed:
+            client = self._factory()
+            self._clients[loop] = client
+            closer = loop.create_task(self._close_at_shutdown(loop, client))
+            self._closers.add(closer)
+            closer.add_done_callback(self._closers.discard)
+        return client
+
+    async def _close_at_shutdown(
+        self, loop: asyncio.AbstractEventLoop, client: httpx.AsyncClient
+    ) -> None:
+        try:
+            await loop.create_future()
+        finally:
+            if self._clients.get(loop) is client:
+                del self._clients[loop]
+            await client.aclose()
@@ -0,0 +1,98 @@
+"""Tests for interface stats and target utilities."""
+
+from types import SimpleNamespace
+from typing import Any
+
+import pytest
+
+from esprit.interface import utils as interface_utils
+from esprit.interface.utils import (
+    LayerProgress,
+    _get_severity_breakdown,
+    _is_localhost_host,
+    _render_severity_breakdown,
+    infer_target_type,
+    update_layer_status,
+)
+
+
+def _make_tracer(reports: list[dict[str, Any]]) -> Any:
+    return SimpleNamespace(vulnerability_reports=reports)
+
+
+class TestSeverityBreakdown:
+    def test_counts_and_renders_known_severities(self) -> None:
+        tracer = _make_tracer(
+            [{"severity": "High"}, {"severity": "critical"}, {"severity": "high"}, {}]
+        )
+        counts, breakdown = _get_severity_breakdown(tracer)
+        assert counts == {"critical": 1, "high": 2, "medium": 0, "low": 0, "info": 0}
+        assert breakdown.plain == "CRITICAL: 1 | HIGH: 2"
+
+    def test_separator_style_does_not_leak(self) -> None:
+        breakdown = _render_severity_breakdown(
+            _make_tracer([{"severity": "critical"}, {"severity": "low"}])
+        )
+        assert breakdown.style == ""
+        separators = [s for s in breakdown.spans if breakdown.plain[s.start : s.end] == " | "]
+        assert [s.style for s in separators] == ["dim white"]
+
+    def test_cached_until_new_report_appended(self) -> None:
+        tracer = _make_tracer([{"severity": "low"}])
+        first = _render_severity_breakdown(tracer)
+        assert _render_severity_breakdown(tracer) is first
+
+        tracer.vulnerability_reports.append({"severity": "medium"})
+        updated = _render_severity_breakdown(tracer)
+        assert updated is not first
+        assert updated.plain == "MEDIUM: 1 | LOW: 1"
+
+    def test_only_latest_tracer_is_cached(self) -> None:
+        first = _make_tracer([{"severity": "low"}])
+        second = _make_tracer([{"severity": "high"}])
+        assert _render_severity_breakdown(first).plain == "LOW: 1"
+        assert _render_severity_breakdown(second).plain == "HIGH: 1"
+        assert interface_utils._severity_cache[0] is second.vulnerability_reports
+        assert _render_severity_breakdown(first).plain == "LOW: 1"
+
+
+class TestInferTargetTypeIp:
+    @pytest.mark.parametrize("target", ["192.168.1.10", "::1", "2001:db8::1"])
+    def test_ip_addresses(self, target: str) -> None:
+        target_type, details = infer_target_type(target)
+        assert target_type == "ip_address"
+        assert details == {"target_ip": target}
+
+    def test_domain_is_not_treated_as_ip(self) -> None:
+        assert infer_target_type("example.com") == (
+            "web_application",
+            {"target_url": "https://example.com"},
+        )
+
+
+class TestIsLocalhostHost:
+    @pytest.mark.parametrize(
+        "host", ["localhost", "LOCALHOST", "127.0.0.1", "127.8.9.10", "::1", "[::1]", "0.0.0.0"]
+    )
+    def test_loopback_hosts(self, host: str) -> None:
+        assert _is_localhost_host(host) is True
+
+    @pytest.mark.parametrize("host", ["example.com", "10.0.0.1", "::2", "127.1", "128.0.0.1"])
+    def test_non_loopback_hosts(self, host: str) -> None:
+        assert _is_localhost_host(host) is False
+
+
+class TestLayerProgress:
+    def test_completed_counter_tracks_transitions(self) -> None:
+        progress = LayerProgress()
+        update_layer_status(progress, "a", "Downloading")
+        update_layer_status(progress, "b", "Already exists")
+        assert progress.completed == 1
+
+        update_layer_status(progress, "a", "Pull complete")
+        update_layer_status(progress, "a", "Pull complete")
+        assert progress.completed == 2
+
+        update_layer_status(progress, "b", "Extracting")
+        assert progress.completed == 1
+        assert progress.layers == {"a": "✓", "b": "📦"}
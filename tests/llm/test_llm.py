@@ -1,8 +1,107 @@
 """Tests for LLM module utilities."""
 
+import asyncio
+from collections.abc import AsyncGenerator
+from types import SimpleNamespace
+from typing import Any
+
+import httpx
 import pytest
 
-from esprit.llm.llm import _mask_email
+from esprit.llm.llm import (
+    LLM,
+    LLMResponse,
+    RequestStats,
+    _history_fingerprint,
+    _mask_email,
+    _model_supports_vision,
+)
+
+
+class _CountingCompressor:
+    def __init__(self) -> None:
+        self.calls = 0
+
+    def compress_history(self, history: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        self.calls += 1
+        return history
+
+
+def _bare_llm(model_name: str = "openai/gpt-5") -> LLM:
+    """An LLM carrying only the state the request-building paths read."""
+    llm = LLM.__new__(LLM)
+    llm.config = SimpleNamespace(model_name=model_name, enable_prompt_caching=False)
+    llm.agent_id = None
+    llm.memory_compressor = _CountingCompressor()
+    llm._total_stats = RequestStats()
+    llm._last_compress_fingerprint = None
+    llm._system_msg = {"role": "system", "content": "sys"}
+    llm._identity_msg = None
+    llm._recompute_model_parts()
+    return llm
+
+
+_ENDPOINTS = ["https://daily.test", "https://prod.test"]
+_URLS = [f"{endpoint}/v1internal:streamGenerateContent?alt=sse" for endpoint in _ENDPOINTS]
+
+
+def _status_error(status_code: int) -> httpx.HTTPStatusError:
+    request = httpx.Request("POST", _URLS[0])
+    response = httpx.Response(status_code, request=request)
+    return httpx.HTTPStatusError(f"HTTP {status_code}", request=request, response=response)
+
+
+class _FakeStreams:
+    """Stand-in for ``_do_antigravity_stream`` scripted per URL and per call.
+
+    Each script item is yielded, or raised if it is an exception; ``None``
+    blocks until the stream is cancelled.
+    """
+
+    def __init__(self, scripts: dict[str, list[list[Any]]]) -> None:
+        self.scripts = scripts
+        self.calls: list[str] = []
+        self.closed: list[str] = []
+
+    async def __call__(
+        self, url: str, _headers: dict[str, str], _body: dict[str, Any]
+    ) -> AsyncGenerator[LLMResponse, None]:
+        self.calls.append(url)
+        try:
+            for item in self.scripts[url].pop(0):
+                if isinstance(item, BaseException):
+                    raise item
+                if item is None:
+                    await asyncio.Event().wait()
+                yield item
+        finally:
+            self.closed.append(url)
+
+
+def _antigravity_llm(monkeypatch: pytest.MonkeyPatch, streams: _FakeStreams) -> LLM:
+    """An Antigravity LLM with endpoint racing on and the HTTP streams faked."""
+    llm = _bare_llm("antigravity/gemini-3-flash")
+    monkeypatch.setattr(llm, "_do_antigravity_stream", streams)
+    credentials = SimpleNamespace(type="oauth", access_token="token", extra={"project_id": "p"})
+
+    class AuthClient:
+        def get_credentials(self, _provider: str) -> SimpleNamespace:
+            return credentials
+
+        async def ensure_valid_credentials(
+            self, _provider: str, creds: SimpleNamespace
+        ) -> SimpleNamespace:
+            return creds
+
+    monkeypatch.setattr("esprit.llm.llm.get_auth_client", AuthClient)
+    monkeypatch.setattr("esprit.llm.llm.ENDPOINTS", _ENDPOINTS)
+    monkeypatch.setenv("ESPRIT_ANTIGRAVITY_RACE_ENDPOINTS", "true")
+    return llm
+
+
+async def _collect(llm: LLM) -> list[str]:
+    messages = [{"role": "user", "content": "hi"}]
+    return [response.content async for response in llm._stream_antigravity(messages)]
 
 
 class TestMaskEmail:
@@ -26,3 +125,246 @@ class TestMaskEmail:
     def test_single_char_local(self) -> None:
         result = _mask_email("a@b.co")
         assert result == "a***@b.c***"
+
+
+class TestCapabilityCache:
+    """Tests for the memoized litellm capability lookups."""
+
+    def test_lookup_is_cached_per_model(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        calls: list[str] = []
+
+        def fake_supports_vision(model: str) -> bool:
+            calls.append(model)
+            return True
+
+        monkeypatch.setattr("esprit.llm.llm.supports_vision", fake_supports_vision)
+        _model_supports_vision.cache_clear()
+        try:
+            assert _model_supports_vision("test/vision-model") is True
+            assert _model_supports_vision("test/vision-model") is True
+            assert calls == ["test/vision-model"]
+        finally:
+            _model_supports_vision.cache_clear()
+
+    def test_lookup_error_means_unsupported(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        def broken(model: str) -> bool:
+            raise ValueError(model)
+
+        monkeypatch.setattr("esprit.llm.llm.supports_vision", broken)
+        _model_supports_vision.cache_clear()
+        try:
+            assert _model_supports_vision("test/unknown-model") is False
+        finally:
+            _model_supports_vision.cache_clear()
+
+
+class TestAddCacheControl:
+    """Tests for the prompt-caching breakpoints."""
+
+    @pytest.fixture(autouse=True)
+    def _caching_model(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        monkeypatch.setattr("esprit.llm.llm._model_supports_prompt_caching", lambda model: True)
+
+    @pytest.mark.parametrize("role", ["user", "assistant"])
+    def test_marks_system_prompt_and_newest_string_turn(self, role: str) -> None:
+        messages = [{"role": "system", "content": "sys"}, {"role": role, "content": "hi"}]
+        result = _bare_llm()._add_cache_control(messages)
+        ephemeral = {"type": "ephemeral"}
+        assert result[0]["content"] == [{"type": "text", "text": "sys", "cache_control": ephemeral}]
+        assert result[1] == {
+            "role": role,
+            "content": [{"type": "text", "text": "hi", "cache_control": ephemeral}],
+        }
+        assert messages[1]["content"] == "hi"
+
+    def test_list_content_is_left_alone(self) -> None:
+        last = {"role": "user", "content": [{"type": "text", "text": "hi"}]}
+        result = _bare_llm()._add_cache_control([{"role": "system", "content": "sys"}, last])
+        assert result[1] is last
+
+    def test_single_message_is_marked_once(self) -> None:
+        result = _bare_llm()._add_cache_control([{"role": "system", "content": "sys"}])
+        assert result == [
+            {
+                "role": "system",
+                "content": [
+                    {"type": "text", "text": "sys", "cache_control": {"type": "ephemeral"}}
+                ],
+            }
+        ]
+
+
+class TestCompressionSkip:
+    """Tests for skipping the memory compressor when no turn was added."""
+
+    def test_unchanged_history_skips_compression(self) -> None:
+        llm = _bare_llm()
+        history = [{"role": "user", "content": "hi"}]
+        llm._prepare_messages(history)
+        llm._prepare_messages(history)
+        assert llm.memory_compressor.calls == 1
+
+    def test_appended_turn_recompresses(self) -> None:
+        llm = _bare_llm()
+        history = [{"role": "user", "content": "hi"}]
+        llm._prepare_messages(history)
+        history.append({"role": "assistant", "content": "hello"})
+        llm._prepare_messages(history)
+        assert llm.memory_compressor.calls == 2
+
+    def test_list_content_extended_in_place_recompresses(self) -> None:
+        llm = _bare_llm()
+        history = [{"role": "user", "content": [{"type": "text", "text": "hi"}]}]
+        llm._prepare_messages(history)
+        history[-1]["content"].append({"type": "text", "text": "more"})
+        llm._prepare_messages(history)
+        assert llm.memory_compressor.calls == 2
+
+    def test_unserializable_content_always_compresses(self) -> None:
+        llm = _bare_llm()
+        history = [{"role": "user", "content": [{"type": "text", "text": object()}]}]
+        assert _history_fingerprint(history) is None
+        llm._prepare_messages(history)
+        llm._prepare_messages(history)
+        assert llm.memory_compressor.calls == 2
+
+
+class TestAntigravityEndpointRace:
+    """Tests for racing Antigravity endpoints and dispatching their errors."""
+
+    async def test_first_response_wins_and_losers_are_closed(
+        self, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        streams = _FakeStreams(
+            {
+                _URLS[0]: [[None]],
+                _URLS[1]: [[LLMResponse(content="first"), LLMResponse(content="second")]],
+            }
+        )
+        llm = _antigravity_llm(monkeypatch, streams)
+
+        raced = await llm._race_antigravity_endpoints(_URLS, {}, {})
+        assert isinstance(raced, tuple)
+        stream, first = raced
+        assert first.content == "first"
+        assert streams.closed == [_URLS[0]]
+        assert [response.content async for response in stream] == ["second"]
+
+    async def test_answering_loser_is_closed(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        streams = _FakeStreams(
+            {url: [[LLMResponse(content=url), LLMResponse(content="more")]] for url in _URLS}
+        )
+        llm = _antigravity_llm(monkeypatch, streams)
+
+        raced = await llm._race_antigravity_endpoints(_URLS, {}, {})
+        assert isinstance(raced, tuple)
+        _, first = raced
+        assert streams.closed == [url for url in _URLS if url != first.content]
+
+    async def test_all_failures_are_returned_by_url(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        errors = [httpx.ConnectError("down"), _status_error(404)]
+        streams = _FakeStreams({url: [[error]] for url, error in zip(_URLS, errors, strict=True)})
+        llm = _antigravity_llm(monkeypatch, streams)
+
+        assert await llm._race_antigravity_endpoints(_URLS, {}, {}) == dict(
+            zip(_URLS, errors, strict=True)
+        )
+        assert sorted(streams.closed) == sorted(_URLS)
+
+    async def test_winning_stream_is_relayed(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        streams = _FakeStreams(
+            {
+                _URLS[0]: [[_status_error(503)]],
+                _URLS[1]: [[LLMResponse(content="a"), LLMResponse(content="b")]],
+            }
+        )
+        llm = _antigravity_llm(monkeypatch, streams)
+
+        assert await _collect(llm) == ["a", "b"]
+        assert streams.calls == _URLS
+
+    async def test_rate_limit_is_raised_without_resending(
+        self, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        streams = _FakeStreams(
+            {
+                _URLS[0]: [[_status_error(429)]],
+                _URLS[1]: [[_status_error(503)]],
+            }
+        )
+        llm = _antigravity_llm(monkeypatch, streams)
+
+        with pytest.raises(httpx.HTTPStatusError) as excinfo:
+            await _collect(llm)
+        assert excinfo.value.response.status_code == 429
+        assert streams.calls == _URLS
+
+    async def test_bad_request_goes_to_retry_helper(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        bad_request = _status_error(400)
+        streams = _FakeStreams(
+            {
+                _URLS[0]: [[bad_request]],
+                _URLS[1]: [[httpx.ConnectError("down")]],
+            }
+        )
+        llm = _antigravity_llm(monkeypatch, streams)
+        retried: list[tuple[str, httpx.HTTPStatusError]] = []
+
+        async def fake_retry(
+            url: str,
+            headers: dict[str, str],
+            body: dict[str, Any],
+            error: httpx.HTTPStatusError,
+        ) -> AsyncGenerator[LLMResponse, None]:
+            retried.append((url, error))
+            yield LLMResponse(content="retried")
+
+        monkeypatch.setattr(llm, "_retry_antigravity_bad_request", fake_retry)
+
+        assert await _collect(llm) == ["retried"]
+        assert retried == [(_URLS[0], bad_request)]
+        assert streams.calls == _URLS
+
+
+class TestAntigravityBadRequestRetry:
+    """Tests for retrying Cloud Code 400s on the same endpoint."""
+
+    @pytest.fixture(autouse=True)
+    def _no_backoff(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        async def no_sleep(delay: float) -> None:
+            pass
+
+        monkeypatch.setattr(asyncio, "sleep", no_sleep)
+
+    async def _retry(self, llm: LLM) -> list[str]:
+        retry = llm._retry_antigravity_bad_request(_URLS[0], {}, {}, _status_error(400))
+        return [response.content async for response in retry]
+
+    async def test_recovers_after_transient_bad_request(
+        self, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        streams = _FakeStreams({_URLS[0]: [[_status_error(400)], [LLMResponse(content="ok")]]})
+        llm = _antigravity_llm(monkeypatch, streams)
+
+        assert await self._retry(llm) == ["ok"]
+        assert streams.calls == [_URLS[0], _URLS[0]]
+
+    async def test_persistent_bad_request_raises_the_last_error(
+        self, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        last = _status_error(400)
+        streams = _FakeStreams({_URLS[0]: [[_status_error(400)], [last]]})
+        llm = _antigravity_llm(monkeypatch, streams)
+
+        with pytest.raises(httpx.HTTPStatusError) as excinfo:
+            await self._retry(llm)
+        assert excinfo.value is last
+
+    async def test_other_status_stops_retrying(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        streams = _FakeStreams({_URLS[0]: [[_status_error(429)], [LLMResponse(content="ok")]]})
+        llm = _antigravity_llm(monkeypatch, streams)
+
+        with pytest.raises(httpx.HTTPStatusError) as excinfo:
+            await self._retry(llm)
+        assert excinfo.value.response.status_code == 429
+        assert streams.calls == [_URLS[0]]
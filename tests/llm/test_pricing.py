@@ -0,0 +1,150 @@
+"""Tests for model pricing lookups."""
+
+import os
+from pathlib import Path
+
+import pytest
+
+from esprit.llm import pricing
+from esprit.llm.pricing import ModelPricing, PricingDB
+
+
+def _db(*names: str) -> PricingDB:
+    db = PricingDB()
+    for name in names:
+        db._data[name] = ModelPricing(input_cost=1e-6, max_input_tokens=1)
+    db._loaded = True
+    db._rebuild_index()
+    return db
+
+
+class TestResolveModel:
+    def test_direct_and_prefixed_lookup(self) -> None:
+        db = _db("anthropic/claude-sonnet-4-5")
+        expected = db._data["anthropic/claude-sonnet-4-5"]
+        assert db.get_pricing("anthropic/claude-sonnet-4-5") is expected
+        assert db.get_pricing("claude-sonnet-4-5") is expected
+
+    def test_prefixed_lookup_follows_prefix_order(self) -> None:
+        db = _db("openai/model-x", "anthropic/model-x")
+        assert db.get_pricing("model-x") is db._data["anthropic/model-x"]
+
+    def test_alias_lookup(self) -> None:
+        db = _db("claude-opus-4-6")
+        assert db.get_pricing("antigravity/claude-opus-4-6-thinking") is db._data["claude-opus-4-6"]
+
+    def test_results_are_memoized_including_misses(self) -> None:
+        db = _db("gpt-5")
+        assert db.get_pricing("unknown-model") is None
+        assert db._resolve_cache == {"unknown-model": None}
+
+    def test_fuzzy_match_on_boundary(self) -> None:
+        db = _db("claude-sonnet-4-5", "gpt-5")
+        assert db.get_pricing("claude-sonnet-4-5-20250514") is db._data["claude-sonnet-4-5"]
+        assert db.get_pricing("gpt-50") is db._data["gpt-5"]
+        assert db.get_pricing("gpt-5x") is None
+
+    def test_fuzzy_match_extending_key_wins_over_shorter_prefix(self) -> None:
+        db = _db("model-9", "vertex_ai/model-9-flash-preview", "model-9-flash-preview")
+        assert db.get_pricing("model-9-flash") is db._data["vertex_ai/model-9-flash-preview"]
+        assert db.get_pricing("model-9x") is None
+        assert db.get_pricing("model-9.1") is db._data["model-9"]
+
+
+class TestCalculateCost:
+    def test_base_and_tiered_rates(self) -> None:
+        rates = ModelPricing(
+            input_cost=1.0, output_cost=2.0, cache_read_cost=0.5, input_cost_above=3.0
+        )
+        assert pricing.calculate_cost(rates, 110, 10, cached_tokens=10) == 100 + 20 + 5
+        over = pricing._TIERED_THRESHOLD + 10
+        assert pricing.calculate_cost(rates, over, 0) == pricing._TIERED_THRESHOLD + 30
+
+
+class TestParseRows:
+    def test_identical_rows_share_one_entry(self) -> None:
+        row = {"input_cost_per_token": 1e-6, "output_cost_per_token": 2e-6}
+        parsed = pricing._parse_rows(
+            {
+                "model-a": row,
+                "model-a-2025": dict(row),
+                "model-b": {"input_cost_per_token": 3e-6},
+                "free-model": {"input_cost_per_token": 0},
+                "bad-row": "n/a",
+            }
+        )
+        assert set(parsed) == {"model-a", "model-a-2025", "model-b"}
+        assert parsed["model-a"] is parsed["model-a-2025"]
+        assert parsed["model-b"] != parsed["model-a"]
+
+
+class TestUsageFile:
+    def test_lifetime_cost_reparsed_only_after_change(
+        self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        usage_file = tmp_path / "usage.json"
+        monkeypatch.setattr(pricing, "_USAGE_FILE", usage_file)
+        monkeypatch.setattr(pricing, "_usage_cache", None)
+        assert pricing.get_lifetime_cost() == 0.0
+
+        assert pricing.add_session_cost(1.25) == 1.25
+        assert pricing.get_lifetime_cost() == 1.25
+
+        # Same inode, mtime and size means the cached parse is reused.
+        stat = usage_file.stat()
+        text = usage_file.read_text(encoding="utf-8")
+        usage_file.write_text(text.replace("1.25", "9.99"), encoding="utf-8")
+        os.utime(usage_file, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        assert pricing.get_lifetime_cost() == 1.25
+
+    def test_replaced_file_with_same_mtime_is_reparsed(
+        self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        usage_file = tmp_path / "usage.json"
+        monkeypatch.setattr(pricing, "_USAGE_FILE", usage_file)
+        monkeypatch.setattr(pricing, "_usage_cache", None)
+        pricing.add_session_cost(1.25)
+        assert pricing.add_session_cost(1.25) == 2.5
+
+        stat = usage_file.stat()
+        text = usage_file.read_text(encoding="utf-8")
+        replacement = tmp_path / "replacement.json"
+        replacement.write_text(text.replace("2.5", "7.5"), encoding="utf-8")
+        os.utime(replacement, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        replacement.replace(usage_file)
+        assert pricing.get_lifetime_cost() == 7.5
+
+
+class TestRemoteRefresh:
+    def test_offline_replays_cache_without_fetching(
+        self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        cache_file = tmp_path / "pricing_cache.json"
+        cache_file.write_text(
+            '{"models": {"model-z": {"input_cost_per_token": 2e-6}}}', encoding="utf-8"
+        )
+        monkeypatch.setattr(pricing, "_REMOTE_CACHE_FILE", cache_file)
+        monkeypatch.setenv("ESPRIT_OFFLINE", "true")
+        db = PricingDB()
+        monkeypatch.setattr(db, "_load_bundled", lambda: setattr(db, "_loaded", True))
+        monkeypatch.setattr(db, "_fetch_remote", lambda: pytest.fail("fetched while offline"))
+
+        db.ensure_loaded()
+        pricing_z = db.get_pricing("model-z")
+        assert pricing_z is not None
+        assert pricing_z.input_cost == 2e-6
+
+    def test_refresh_due_only_for_stale_or_missing_cache(
+        self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        cache_file = tmp_path / "pricing_cache.json"
+        monkeypatch.setattr(pricing, "_REMOTE_CACHE_FILE", cache_file)
+        monkeypatch.delenv("ESPRIT_OFFLINE", raising=False)
+        assert pricing._remote_refresh_due() is True
+
+        cache_file.write_text('{"models": {}}', encoding="utf-8")
+        assert pricing._remote_refresh_due() is False
+
+        stale = cache_file.stat().st_mtime - pricing._REMOTE_REFRESH_INTERVAL_S - 1
+        os.utime(cache_file, (stale, stale))
+        assert pricing._remote_refresh_due() is True
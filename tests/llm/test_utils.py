@@ -0,0 +1,59 @@
+"""Tests for LLM streaming utilities."""
+
+import pytest
+
+from esprit.llm.utils import StreamAccumulator, ThinkingAccumulator
+
+
+class TestStreamAccumulator:
+    def test_joins_deltas_without_boundary(self) -> None:
+        buffer = StreamAccumulator()
+        assert buffer.add("hello ") is False
+        assert buffer.add("world") is False
+        assert buffer.text == "hello world"
+        assert len(buffer) == 11
+
+    def test_stops_at_closing_tag_split_across_deltas(self) -> None:
+        buffer = StreamAccumulator()
+        for delta in ["<function=x>body</fun", "ction>", "trailing"]:
+            if buffer.add(delta):
+                break
+        assert buffer.done is True
+        assert buffer.text == "<function=x>body</function>"
+
+    def test_truncates_within_single_delta(self) -> None:
+        buffer = StreamAccumulator()
+        assert buffer.add("a</function>b</function>") is True
+        assert buffer.add("more") is True
+        assert buffer.text == "a</function>"
+
+    def test_should_emit_coalesces_small_deltas(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        monkeypatch.setattr("esprit.llm.utils.time.monotonic", lambda: 100.0)
+        buffer = StreamAccumulator()
+        buffer.add("a")
+        assert buffer.should_emit() is True
+        buffer.add("b")
+        assert buffer.should_emit() is False
+        buffer.add("c" * 64)
+        assert buffer.should_emit() is True
+
+
+class TestThinkingAccumulator:
+    def test_merges_thinking_fragments_with_signature(self) -> None:
+        thinking = ThinkingAccumulator()
+        thinking.add([{"type": "thinking", "thinking": "step one, "}])
+        thinking.add(None)
+        thinking.add([{"type": "thinking", "thinking": "step two"}])
+        thinking.add([{"type": "thinking", "thinking": "", "signature": "sig"}])
+        assert thinking.blocks() == [
+            {"type": "thinking", "thinking": "step one, step two", "signature": "sig"}
+        ]
+
+    def test_keeps_redacted_blocks(self) -> None:
+        thinking = ThinkingAccumulator()
+        redacted = {"type": "redacted_thinking", "data": "opaque"}
+        thinking.add([redacted])
+        assert thinking.blocks() == [redacted]
+
+    def test_no_blocks(self) -> None:
+        assert ThinkingAccumulator().blocks() is None
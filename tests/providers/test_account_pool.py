@@ -175,9 +175,25 @@ class TestAccountSelection:
 
         result = tmp_pool.get_best_account("openai")
         assert result is not None
+        tmp_pool.flush()
         mtime_after = tmp_pool.accounts_file.stat().st_mtime_ns
         assert mtime_after > mtime_before
 
+    def test_repeat_selection_skips_save(self, tmp_pool: AccountPool) -> None:
+        tmp_pool.add_account("openai", _make_creds("a@t.com"), "a@t.com")
+        first = tmp_pool.get_best_account("openai")
+        assert first is not None
+        mtime_before = tmp_pool.accounts_file.stat().st_mtime_ns
+
+        time.sleep(0.01)
+
+        again = tmp_pool.get_best_account("openai")
+        assert again is not None
+        assert again.email == first.email
+        assert tmp_pool.accounts_file.stat().st_mtime_ns == mtime_before
+        # The fresher timestamp is still visible in memory
+        assert tmp_pool.list_accounts("openai")[0].last_used == again.last_used
+
     def test_sticky_prefers_current(self, tmp_pool: AccountPool) -> None:
         tmp_pool.add_account("openai", _make_creds("a@t.com", access="tok_a"), "a@t.com")
         tmp_pool.add_account("openai", _make_creds("b@t.com", access="tok_b"), "b@t.com")
@@ -214,6 +230,36 @@ class TestRateLimiting:
         assert accounts[0].consecutive_429s == 1
         assert accounts[0].cooling_until is not None
 
+    def test_rate_limit_persisted_after_flush(self, tmp_pool: AccountPool) -> None:
+        tmp_pool.add_account("openai", _make_creds("rl@t.com"), "rl@t.com")
+        tmp_pool.mark_rate_limited("openai", "rl@t.com", "gpt-5", 60.0)
+        tmp_pool.flush()
+
+        pool2 = AccountPool(config_dir=tmp_pool.config_dir)
+        assert "gpt-5" in pool2.list_accounts("openai")[0].rate_limits
+
+    def test_snapshot_does_not_share_live_limits(self, tmp_pool: AccountPool) -> None:
+        tmp_pool.add_account("openai", _make_creds("snap@t.com"), "snap@t.com")
+        tmp_pool.mark_rate_limited("openai", "snap@t.com", "gpt-5", 60.0)
+        snapshot = tmp_pool._snapshot()
+
+        tmp_pool.mark_rate_limited("openai", "snap@t.com", "gpt-4o", 60.0)
+        acct = snapshot["openai"]["accounts"][0]
+        assert set(acct["rate_limits"]) == {"gpt-5"}
+        assert tmp_pool.list_accounts("openai")[0].credentials.extra is not (
+            acct["credentials"]["extra"]
+        )
+
+    def test_expired_limit_is_cleared(self, tmp_pool: AccountPool) -> None:
+        tmp_pool.add_account("openai", _make_creds("exp@t.com"), "exp@t.com")
+        tmp_pool.mark_rate_limited("openai", "exp@t.com", "gpt-5", 0.0)
+        tmp_pool.mark_rate_limited("openai", "exp@t.com", "gpt-4o", 3600.0)
+
+        acct = tmp_pool.peek_best_account("openai")
+        assert acct is not None
+        assert "gpt-5" not in acct.rate_limits
+        assert "gpt-4o" in acct.rate_limits
+
     def test_escalating_backoff(self, tmp_pool: AccountPool) -> None:
         tmp_pool.add_account("openai", _make_creds("esc@t.com"), "esc@t.com")
 
@@ -0,0 +1,214 @@
+"""Tests for Antigravity provider utilities."""
+
+import asyncio
+import base64
+import contextlib
+import hashlib
+import json
+
+import pytest
+
+from esprit.providers import antigravity
+from esprit.providers.antigravity import (
+    ANTIGRAVITY_FALLBACK_CHAIN,
+    AntigravityProvider,
+    _bind_callback_socket,
+    _email_from_id_token,
+    _fetch_email,
+    _generate_pkce,
+    _generate_state,
+    _wait_for_callback,
+    get_fallback_models,
+)
+from esprit.utils.loop_clients import LoopClients
+
+
+class TestPKCE:
+    def test_challenge_is_unpadded_s256_of_verifier(self) -> None:
+        verifier, challenge = _generate_pkce()
+        digest = hashlib.sha256(verifier.encode()).digest()
+        assert challenge == base64.urlsafe_b64encode(digest).rstrip(b"=").decode()
+        assert len(challenge) == 43
+
+    def test_state_is_unpadded_and_unique(self) -> None:
+        state = _generate_state()
+        assert len(state) == 43
+        assert "=" not in state
+        assert state != _generate_state()
+
+
+class TestEmailFromIdToken:
+    def test_reads_email_claim(self) -> None:
+        payload = base64.urlsafe_b64encode(json.dumps({"email": "a@b.com"}).encode())
+        token = f"header.{payload.rstrip(b'=').decode()}.sig"
+        assert _email_from_id_token(token) == "a@b.com"
+
+    def test_missing_or_malformed_token(self) -> None:
+        assert _email_from_id_token(None) is None
+        assert _email_from_id_token("not-a-jwt") is None
+        assert _email_from_id_token("a.!!!.c") is None
+        payload = base64.urlsafe_b64encode(b'{"sub": "1"}').decode()
+        assert _email_from_id_token(f"a.{payload}.c") is None
+
+
+async def _get(port: int, path: str) -> bytes:
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode())
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    return response.split(b"\r\n", 1)[0]
+
+
+class TestWaitForCallback:
+    async def test_returns_code_and_ignores_other_paths(self) -> None:
+        sock = _bind_callback_socket()
+        port = sock.getsockname()[1]
+        # The socket already listens, so requests made before serving starts are queued
+        waiter = asyncio.create_task(_wait_for_callback(sock, "state-1"))
+
+        assert await _get(port, "/favicon.ico") == b"HTTP/1.1 404 Not Found"
+        status = await _get(port, "/oauth2callback?code=abc&state=state-1")
+        assert status == b"HTTP/1.1 200 OK"
+        assert await waiter == ("abc", None)
+        assert sock.fileno() == -1
+
+    async def test_state_mismatch_is_an_error(self) -> None:
+        sock = _bind_callback_socket()
+        waiter = asyncio.create_task(_wait_for_callback(sock, "state-1"))
+
+        status = await _get(sock.getsockname()[1], "/oauth2callback?code=abc&state=other")
+        assert status == b"HTTP/1.1 400 Bad Request"
+        assert await waiter == (None, "Invalid callback")
+
+    async def test_oversized_requests_are_dropped(self) -> None:
+        sock = _bind_callback_socket()
+        port = sock.getsockname()[1]
+        waiter = asyncio.create_task(_wait_for_callback(sock, "state-1"))
+
+        for payload in (
+            b"GET /" + b"a" * 70_000 + b" HTTP/1.1\r\n\r\n",
+            b"GET /oauth2callback HTTP/1.1\r\n" + b"X: y\r\n" * 200 + b"\r\n",
+        ):
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(payload)
+            await writer.drain()
+            # A reset is fine too: the server closed with unread input still buffered
+            with contextlib.suppress(ConnectionResetError):
+                assert await reader.read() == b""
+            writer.close()
+
+        status = await _get(port, "/oauth2callback?code=abc&state=state-1")
+        assert status == b"HTTP/1.1 200 OK"
+        assert await waiter == ("abc", None)
+
+    async def test_times_out_without_callback(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        monkeypatch.setattr(antigravity, "CALLBACK_TIMEOUT", 0.05)
+        assert await _wait_for_callback(_bind_callback_socket(), "state-1") == (None, None)
+
+
+class TestGetFallbackModels:
+    def test_known_model_falls_back_to_later_entries(self) -> None:
+        assert get_fallback_models("antigravity/gemini-3-pro-low") == (
+            "gemini-2.5-pro",
+            "gemini-3-flash",
+            "gemini-2.5-flash",
+            "gemini-2.5-flash-thinking",
+            "gemini-2.5-flash-lite",
+        )
+        assert get_fallback_models("gemini-2.5-flash-lite") == ()
+
+    def test_unknown_model_starts_at_gemini_3_flash(self) -> None:
+        chain = ANTIGRAVITY_FALLBACK_CHAIN
+        expected = tuple(chain[chain.index("gemini-3-flash"):])
+        assert get_fallback_models("some-model") == expected
+        assert get_fallback_models("some-model") is get_fallback_models("some-model")
+
+
+class TestPendingAuth:
+    async def test_overlapping_logins_keep_separate_state(self) -> None:
+        provider = AntigravityProvider()
+        first = await provider.authorize()
+        second = await provider.authorize()
+        assert set(provider._pending_auth) == {first.verifier, second.verifier}
+        assert first.url != second.url
+
+    async def test_abandoned_logins_are_evicted(self) -> None:
+        provider = AntigravityProvider()
+        first = await provider.authorize()
+        stale = provider._pending_auth[first.verifier]
+        stale.created_at -= antigravity.CALLBACK_TIMEOUT + 1
+        await provider.authorize()
+        assert first.verifier not in provider._pending_auth
+        assert stale.sock.fileno() == -1
+
+        for _ in range(antigravity._MAX_PENDING_AUTH + 2):
+            await provider.authorize()
+        assert len(provider._pending_auth) == antigravity._MAX_PENDING_AUTH
+
+    async def test_callback_for_unknown_flow_fails(self) -> None:
+        provider = AntigravityProvider()
+        first = await provider.authorize()
+        first.verifier = "unknown"
+        result = await provider.callback(first)
+        assert result.success is False
+        assert result.error == "Missing PKCE/state/port"
+
+
+class TestSharedClient:
+    def test_one_client_per_loop_closed_at_shutdown(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        class Client:
+            is_closed = False
+
+            async def aclose(self) -> None:
+                self.is_closed = True
+
+        monkeypatch.setattr(antigravity, "_clients", LoopClients(Client))
+
+        async def grab() -> tuple[object, object]:
+            return antigravity._get_client(), antigravity._get_client()
+
+        first, again = asyncio.run(grab())
+        assert first is again
+        assert first.is_closed
+        second, _ = asyncio.run(grab())
+        assert second is not first
+
+
+class TestFetchEmail:
+    async def test_unknown_when_userinfo_fails(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        class FailingClient:
+            async def get(self, *_args: object, **_kwargs: object) -> None:
+                raise OSError("offline")
+
+        monkeypatch.setattr(antigravity, "_get_client", FailingClient)
+        assert await _fetch_email("token") == "unknown"
+
+
+class TestEndpointBackoff:
+    async def test_failing_endpoint_is_skipped_until_it_recovers(
+        self, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        down = antigravity.LOAD_ENDPOINTS[0]
+        calls: list[str] = []
+
+        class Response:
+            content = b'{"cloudaicompanionProject": "proj-1"}'
+
+            def __init__(self, status_code: int) -> None:
+                self.status_code = status_code
+                self.is_success = status_code == 200
+
+        class Client:
+            async def post(self, url: str, **_kwargs: object) -> Response:
+                calls.append(url)
+                return Response(503 if url.startswith(down) else 200)
+
+        monkeypatch.setattr(antigravity, "_get_client", Client)
+        monkeypatch.setattr(antigravity, "_endpoint_backoff", {})
+
+        assert await antigravity._query_project("token") == ("proj-1", None)
+        assert down in antigravity._endpoint_backoff
+        calls.clear()
+        assert await antigravity._query_project("token") == ("proj-1", None)
+        assert not any(url.startswith(down) for url in calls)
@@ -1,14 +1,20 @@
 """Tests for Antigravity/Cloud Code format conversion."""
 
+import hashlib
 import json
+import sys
+from collections.abc import AsyncIterator
 
 import pytest
 
 from esprit.providers.antigravity_format import (
     _convert_messages,
     _convert_tools,
+    _convert_tools_cached,
     _sanitize_schema,
+    aiter_sse_data,
     build_cloudcode_request,
+    build_request_headers,
     parse_finish_reason,
     parse_sse_chunk,
 )
@@ -83,6 +89,31 @@ class TestSanitizeSchema:
         assert _sanitize_schema(42) is None
         assert _sanitize_schema(None) is None
 
+    def test_nesting_deeper_than_recursion_limit(self) -> None:
+        root: dict = {"type": "object"}
+        node = root
+        for _ in range(sys.getrecursionlimit() + 100):
+            child = {"type": "object"}
+            node["properties"] = {"child": child}
+            node = child
+        node["properties"] = {"leaf": {"type": "string"}}
+
+        result = _sanitize_schema(root)
+        while "child" in result["properties"]:
+            result = result["properties"]["child"]
+        assert result["properties"]["leaf"] == {"type": "STRING"}
+
+    def test_shared_and_self_referencing_subschemas(self) -> None:
+        shared = {"type": "string", "description": "id"}
+        schema: dict = {"type": "object", "properties": {"a": shared, "b": shared}}
+        schema["properties"]["loop"] = schema
+
+        result = _sanitize_schema(schema)
+        assert result["properties"] == {
+            "a": {"type": "STRING", "description": "id"},
+            "b": {"type": "STRING", "description": "id"},
+        }
+
 
 # ── Message Conversion ────────────────────────────────────────
 
@@ -90,14 +121,14 @@ class TestSanitizeSchema:
 class TestConvertMessages:
     def test_system_message(self) -> None:
         msgs = [{"role": "system", "content": "You are helpful."}]
-        sys_instr, contents = _convert_messages(msgs)
+        sys_instr, contents, _ = _convert_messages(msgs)
         assert sys_instr is not None
         assert sys_instr["parts"][0]["text"] == "You are helpful."
         assert contents == []
 
     def test_user_message(self) -> None:
         msgs = [{"role": "user", "content": "Hello"}]
-        sys_instr, contents = _convert_messages(msgs)
+        sys_instr, contents, _ = _convert_messages(msgs)
         assert sys_instr is None
         assert len(contents) == 1
         assert contents[0]["role"] == "user"
@@ -105,10 +136,31 @@ class TestConvertMessages:
 
     def test_assistant_message(self) -> None:
         msgs = [{"role": "assistant", "content": "Hi there!"}]
-        _, contents = _convert_messages(msgs)
+        _, contents, _ = _convert_messages(msgs)
         assert contents[0]["role"] == "model"
         assert contents[0]["parts"][0]["text"] == "Hi there!"
 
+    def test_first_user_text(self) -> None:
+        msgs = [
+            {"role": "system", "content": "sys"},
+            {"role": "user", "content": [{"type": "text", "text": "first"}]},
+            {"role": "user", "content": "second"},
+        ]
+        assert _convert_messages(msgs)[2] == "first"
+        assert _convert_messages([{"role": "assistant", "content": "x"}])[2] == ""
+
+    def test_tool_call_arguments(self) -> None:
+        def call_args(arguments: object) -> object:
+            tc = {"id": "c1", "function": {"name": "f", "arguments": arguments}}
+            _, contents, _ = _convert_messages([{"role": "assistant", "tool_calls": [tc]}])
+            return contents[0]["parts"][0]["functionCall"]["args"]
+
+        assert call_args("") == {}
+        assert call_args("{}") == {}
+        assert call_args(None) == {}
+        assert call_args('{"a": 1}') == {"a": 1}
+        assert call_args("not json") == {"raw": "not json"}
+
     def test_tool_call_id_to_function_name_mapping(self) -> None:
         """Critical fix C3: functionResponse.name should be the function name, not the tool_call_id."""
         msgs = [
@@ -132,7 +184,7 @@ class TestConvertMessages:
                 "content": "file1.txt\nfile2.txt",
             },
         ]
-        _, contents = _convert_messages(msgs)
+        _, contents, _ = _convert_messages(msgs)
 
         # Assistant message with tool call
         assert len(contents) >= 2
@@ -154,7 +206,7 @@ class TestConvertMessages:
                 "content": "some result",
             },
         ]
-        _, contents = _convert_messages(msgs)
+        _, contents, _ = _convert_messages(msgs)
         fr = contents[0]["parts"][0]["functionResponse"]
         # Falls back to using the id as name
         assert fr["name"] == "call_orphan"
@@ -173,7 +225,7 @@ class TestConvertMessages:
             {"role": "tool", "tool_call_id": "call_1", "content": "contents"},
             {"role": "tool", "tool_call_id": "call_2", "content": "ok"},
         ]
-        _, contents = _convert_messages(msgs)
+        _, contents, _ = _convert_messages(msgs)
         # Tool responses
         assert contents[1]["parts"][0]["functionResponse"]["name"] == "read_file"
         assert contents[2]["parts"][0]["functionResponse"]["name"] == "write_file"
@@ -183,7 +235,7 @@ class TestConvertMessages:
         msgs = [
             {"role": "tool", "tool_call_id": "call_x", "content": '{"status": "ok"}'},
         ]
-        _, contents = _convert_messages(msgs)
+        _, contents, _ = _convert_messages(msgs)
         resp = contents[0]["parts"][0]["functionResponse"]["response"]
         assert resp == {"status": "ok"}
 
@@ -192,7 +244,7 @@ class TestConvertMessages:
         msgs = [
             {"role": "tool", "tool_call_id": "call_x", "content": "plain text"},
         ]
-        _, contents = _convert_messages(msgs)
+        _, contents, _ = _convert_messages(msgs)
         resp = contents[0]["parts"][0]["functionResponse"]["response"]
         assert resp == {"result": "plain text"}
 
@@ -231,6 +283,19 @@ class TestConvertTools:
         tools = [{"type": "code_interpreter"}]
         assert _convert_tools(tools) is None
 
+    def test_repeated_tool_set_reuses_conversion_as_a_copy(self) -> None:
+        def tools(description: str) -> list[dict]:
+            return [{"type": "function", "function": {"name": "f", "description": description}}]
+
+        _convert_tools_cached.cache_clear()
+        first = _convert_tools(tools("a"))
+        first[0]["functionDeclarations"].clear()
+        again = _convert_tools(tools("a"))
+        assert again[0]["functionDeclarations"][0]["description"] == "a"
+        assert _convert_tools_cached.cache_info().hits == 1
+        changed = _convert_tools(tools("b"))
+        assert changed[0]["functionDeclarations"][0]["description"] == "b"
+
 
 # ── Request Building ──────────────────────────────────────────
 
@@ -244,6 +309,18 @@ class TestBuildRequest:
         assert req["requestType"] == "agent"
         assert "contents" in req["request"]
 
+    def test_session_id_follows_first_user_message(self) -> None:
+        first = [{"role": "user", "content": "Hello"}]
+        later = [
+            *first,
+            {"role": "assistant", "content": "Hi"},
+            {"role": "user", "content": "More"},
+        ]
+        expected = hashlib.sha256(b"Hello").hexdigest()[:32]
+        for msgs in (first, later):
+            req = build_cloudcode_request(msgs, "gemini-3-flash", "proj")
+            assert req["request"]["sessionId"] == expected
+
     def test_thinking_config_claude(self) -> None:
         """Cloud Code uses snake_case for Claude thinking config."""
         msgs = [{"role": "user", "content": "Think about this"}]
@@ -275,6 +352,23 @@ class TestBuildRequest:
         assert req["request"]["toolConfig"]["functionCallingConfig"]["mode"] == "VALIDATED"
 
 
+class TestBuildRequestHeaders:
+    def test_static_headers(self) -> None:
+        headers = build_request_headers("tok", "gemini-3-flash")
+        assert headers["Authorization"] == "Bearer tok"
+        assert headers["User-Agent"].startswith("antigravity/")
+        assert headers["Client-Metadata"] == (
+            '{"ideType": "IDE_UNSPECIFIED", "platform": "PLATFORM_UNSPECIFIED", '
+            '"pluginType": "GEMINI"}'
+        )
+        assert "anthropic-beta" not in headers
+
+    def test_claude_thinking_beta(self) -> None:
+        headers = build_request_headers("tok", "claude-opus-4-6-thinking")
+        assert headers["anthropic-beta"] == "interleaved-thinking-2025-05-14"
+        assert "anthropic-beta" not in build_request_headers("tok", "claude-sonnet-4-5")
+
+
 # ── Response Parsing ──────────────────────────────────────────
 
 
@@ -292,6 +386,13 @@ class TestParseSSEChunk:
         assert thinking == []
         assert tools == []
 
+    def test_text_parts_are_concatenated(self) -> None:
+        parts = [{"text": "Hel"}, {"thought": True, "text": "hmm"}, {"text": "lo"}]
+        chunk = {"response": {"candidates": [{"content": {"parts": parts}}]}}
+        text, thinking, _, _ = parse_sse_chunk(chunk)
+        assert text == "Hello"
+        assert thinking == [{"type": "thinking", "thinking": "hmm"}]
+
     def test_thinking_block(self) -> None:
         chunk = {
             "response": {
@@ -330,6 +431,15 @@ class TestParseSSEChunk:
         assert len(tools) == 1
         assert tools[0]["function"]["name"] == "read_file"
         assert tools[0]["id"] == "call_xyz"
+        assert json.loads(tools[0]["function"]["arguments"]) == {"path": "/tmp/x"}
+
+    def test_function_call_without_id_gets_generated_id(self) -> None:
+        parts = [{"functionCall": {"name": "ls"}}]
+        chunk = {"candidates": [{"content": {"parts": parts}}]}
+        _, _, tools, _ = parse_sse_chunk(chunk)
+        assert tools[0]["id"].startswith("call_")
+        assert tools[0]["function"]["arguments"] == "{}"
+        assert parse_sse_chunk({"candidates": [{"finishReason": "STOP"}]}) == ("", [], [], {})
 
     def test_usage_metadata(self) -> None:
         chunk = {
@@ -364,3 +474,16 @@ class TestParseFinishReason:
 
     def test_no_candidates(self) -> None:
         assert parse_finish_reason({"response": {"candidates": []}}) is None
+
+
+# ── SSE Framing ─────────────────────────────────────────────────
+
+
+class TestAiterSSEData:
+    async def test_splits_data_lines_across_chunks(self) -> None:
+        async def stream() -> AsyncIterator[bytes]:
+            for piece in (b'data: {"a"', b":1}\r\n\nevent: x\ndata: [DO", b"NE]"):
+                yield piece
+
+        payloads = [data async for data in aiter_sse_data(stream())]
+        assert payloads == [b'{"a":1}', b"[DONE]"]